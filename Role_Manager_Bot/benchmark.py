@@ -0,0 +1,430 @@
+"""
+This file holds the benchmark of the export and import code paths.
+It generates synthetic servers (10 to 250 roles, every permission flag in use) and runs
+export_guild, the export of the Channels and Members tabs and the import executor against
+an in-process fake of the Sheets v4 API and a fake Discord server, so it runs offline. For every scenario it reports the wall time,
+the amount of Sheets and Discord requests, the bytes sent to Sheets and the peak memory.
+The request and operation counts are deterministic and checked against EXPECTED, and the benchmark
+exits with 1 when one of them is off, so it doubles as a regression gate in CI.
+
+Usage: python benchmark.py [--roles 10,50,100,250] [--members 10000] [--seed 0] [--json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+
+import discord
+
+import config_store
+import sheets_client
+from exporter import export_guild
+from importer import new_checkpoint, plan_import, run_import
+from permission_codec import ALL_PERMISSIONS
+from quota import LocalTokenBucket
+from request_data import build_rows
+from sheet_reader import CHUNK_ROWS, open_sheet
+from tab_exporter import MAX_REQUEST_BYTES, export_tabs
+
+SPREADSHEET_ID = "B" * 44
+
+
+"""
+Fake of the part of the Sheets v4 API the BOT uses. The sheet is kept as a dict of cells,
+and every executed request is counted along with the size of its JSON body.
+"""
+class FakeRequest:
+    def __init__(self, sheets, method, body, apply):
+        self.sheets = sheets
+        self.method = method
+        self.body = body
+        self.apply = apply
+
+    def execute(self, **kwargs):
+        self.sheets.requests += 1
+        self.sheets.payload_bytes += len(json.dumps(self.body, ensure_ascii=False).encode("utf-8")) if self.body is not None else 0
+        return self.apply()
+
+
+class FakeSheets:
+    def __init__(self):
+        self.cells = {}  # (row, column) -> value, both 0-based, of the first sheet.
+        self.size = [1000, 26]  # Rows and columns of the first sheet, those of a new spreadsheet.
+        self.tabs = {}  # Title of the other tabs -> {"sheetId": ..., "rows": rows written}. Their values are not kept, so that the peak memory is the exporter's.
+        self.requests = 0
+        self.payload_bytes = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _write(self, cell_range, values):
+        if "!" in cell_range:
+            title, start = cell_range.rsplit("!", 1)
+            tab = self.tabs[title[1:-1].replace("''", "'")]
+            tab["rows"] = max(tab["rows"], _a1_cell(start)[0] + len(values))
+            return
+        start = cell_range.split(":")[0]
+        row, column = _a1_cell(start)
+        for row_offset, row_values in enumerate(values):
+            for column_offset, value in enumerate(row_values):
+                if value == "":
+                    self.cells.pop((row + row_offset, column + column_offset), None)
+                else:
+                    self.cells[(row + row_offset, column + column_offset)] = value
+
+    """
+    Returns the cells of an A1 range ("A2:C10", "1:1", "A:A") like Google does,
+    without the trailing empty cells and rows.
+    """
+    def _read(self, cell_range):
+        start, end = cell_range.split(":")
+        first_row, first_column = _a1_cell(start)
+        last_row, last_column = _a1_cell(end, end=True)
+        cells = {(row, column): value for (row, column), value in self.cells.items() if first_row <= row <= last_row and first_column <= column <= last_column}
+        if not cells:
+            return {"range": cell_range}
+        grid = [[] for _ in range(max(row for row, _ in cells) - first_row + 1)]
+        for (row, column), value in sorted(cells.items()):
+            grid[row - first_row] += [""] * (column - first_column + 1 - len(grid[row - first_row]))
+            grid[row - first_row][column - first_column] = value
+        return {"range": cell_range, "values": grid}
+
+    def batchUpdate(self, spreadsheetId, body):
+        if "requests" in body:  # spreadsheets().batchUpdate, only the requests of exporter.py and tab_exporter.py.
+            return FakeRequest(self, "batchUpdate", body, lambda: {"replies": [self._tab_request(request) for request in body["requests"]]})
+        return FakeRequest(self, "batchUpdate", body, lambda: [self._write(data["range"], data["values"]) for data in body["data"]])
+
+    def _tab_request(self, request):
+        if request.get("updateCells", {}).get("start", {}).get("sheetId") == 0:
+            self._write("A1", [[cell.get("userEnteredValue", {}).get("stringValue", "") for cell in row["values"]] for row in request["updateCells"]["rows"]])
+            return {}
+        if request.get("updateCells", {}).get("range", {}).get("sheetId") == 0:
+            self.cells.clear()
+            return {}
+        if request.get("appendDimension", {}).get("sheetId") == 0:
+            self.size[request["appendDimension"]["dimension"] == "COLUMNS"] += request["appendDimension"]["length"]
+            return {}
+        if "addSheet" in request:
+            properties = dict(request["addSheet"]["properties"], sheetId=len(self.tabs) + 1)
+            self.tabs[properties["title"]] = {"sheetId": properties["sheetId"], "rows": 0}
+            return {"addSheet": {"properties": properties}}
+        if "updateCells" in request:
+            for tab in self.tabs.values():
+                if tab["sheetId"] == request["updateCells"]["range"]["sheetId"]:
+                    tab["rows"] = 0
+        return {}
+
+    def clear(self, spreadsheetId, range, body):
+        return FakeRequest(self, "clear", body, lambda: self.cells.clear())
+
+    def get(self, spreadsheetId, range=None, fields=None):
+        if range is None:  # spreadsheets().get, the metadata of the tabs.
+            first_sheet = {"properties": {"sheetId": 0, "title": "Sheet1", "gridProperties": {"rowCount": self.size[0], "columnCount": self.size[1]}}}
+            return FakeRequest(self, "get", None, lambda: {"sheets": [first_sheet] + [{"properties": {"sheetId": tab["sheetId"], "title": title}} for title, tab in self.tabs.items()]})
+        return FakeRequest(self, "get", None, lambda: self._read(range))
+
+    def batchGet(self, spreadsheetId, ranges):
+        return FakeRequest(self, "batchGet", None, lambda: {"valueRanges": [self._read(cell_range) for cell_range in ranges]})
+
+
+"""
+Converts an A1 cell ("B3") to 0-based (row, column). A missing row or column ("A", "1") stands for all of them:
+the first one at the start of a range and the last one at its end.
+"""
+def _a1_cell(cell, end=False):
+    letters = "".join(character for character in cell if character.isalpha())
+    digits = cell[len(letters):]
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - 64
+    missing = 10 ** 6 if end else 0
+    return (int(digits) - 1 if digits else missing), (column - 1 if letters else missing)
+
+
+"""
+Fake of the parts of discord.Role and discord.Guild the BOT uses. Every call that would
+reach Discord is counted as one request.
+"""
+class FakeRole:
+    def __init__(self, guild, role_id, name, position, permissions, color, managed=False):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.position = position
+        self.permissions = discord.Permissions(permissions)
+        self.color = discord.Colour(color)
+        self.managed = managed
+
+    def is_default(self):
+        return self.id == self.guild.id
+
+    def __lt__(self, other):
+        return (self.position, self.id) < (other.position, other.id)
+
+    def __ge__(self, other):
+        return not self < other
+
+    async def edit(self, name=None, permissions=None, color=None):
+        self.guild.requests += 1
+        self.name = name if name is not None else self.name
+        self.permissions = permissions if permissions is not None else self.permissions
+        self.color = color if color is not None else self.color
+
+    async def delete(self):
+        self.guild.requests += 1
+        self.guild.remove(self)
+
+
+"""
+Fake of the parts of discord.abc.GuildChannel and discord.Member the Channels and Members tabs use.
+"""
+class FakeChannel:
+    def __init__(self, channel_id, name, channel_type, overwrites):
+        self.id = channel_id
+        self.name = name
+        self.type = channel_type
+        self.overwrites = overwrites
+
+
+class FakeMember:
+    def __init__(self, member_id, roles):
+        self.id = member_id
+        self.roles = roles
+
+    def __str__(self):
+        return "Member " + str(self.id)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.requests = 0
+        self.me = None
+        self.member_count = 0
+        self.member_seed = 0
+        self.categories = []  # (category, channels) pairs, like discord.Guild.by_category().
+        self._roles = {}
+        self._next_id = guild_id
+
+    @property
+    def roles(self):
+        return sorted(self._roles.values())  # Bottom to top, like discord.Guild.roles.
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def add(self, name, position, permissions, color, managed=False):
+        role = FakeRole(self, self._next_id, name, position, permissions, color, managed)
+        self._roles[role.id] = role
+        self._next_id += 1
+        return role
+
+    def remove(self, role):
+        del self._roles[role.id]
+        for other in self._roles.values():
+            if other.position > role.position:
+                other.position -= 1
+
+    async def create_role(self, name, permissions, color):
+        self.requests += 1
+        for role in self._roles.values():  # New roles go right above @everyone.
+            if role.position >= 1:
+                role.position += 1
+        return self.add(name, 1, permissions.value, color.value)
+
+    async def edit_role_positions(self, positions):
+        self.requests += 1
+        for role, position in positions.items():
+            role.position = position
+
+    @property
+    def channels(self):
+        return [channel for category, channels in self.categories for channel in [category] + channels]
+
+    def by_category(self):
+        return self.categories
+
+    """
+    Generates the members again on every call, 1000 per request like Discord, so that the fake holds none of them.
+    """
+    async def fetch_members(self, limit=1000):
+        generator = random.Random(self.member_seed)
+        roles = self.roles[1:-1]  # Neither @everyone nor the BOT's role.
+        for index in range(self.member_count):
+            if index % 1000 == 0:
+                self.requests += 1
+            yield FakeMember(self.id * 1000000 + index, generator.sample(roles, min(len(roles), generator.randrange(4))))
+
+
+"""
+Builds a server with @everyone, role_count - 2 roles with random permissions and colors,
+and the BOT's own role on top, so that it can manage every other role.
+"""
+def synthetic_guild(guild_id, role_count, generator):
+    guild = FakeGuild(guild_id)
+    guild.add("@everyone", 0, discord.Permissions.general().value, 0)
+    for index in range(role_count - 2):
+        guild.add("Role " + str(index), index + 1, generator.getrandbits(64) & ALL_PERMISSIONS, generator.randrange(0x1000000))
+    guild.me = type("Member", (), {"top_role": guild.add("Role Manager", role_count - 1, 8, 0, managed=True)})()
+    return guild
+
+
+"""
+Adds channels (5 categories of 10) with a few permission overwrites each, and member_count members
+holding up to 3 random roles, to a synthetic server.
+"""
+def add_channels_and_members(guild, member_count, generator):
+    roles = guild.roles
+    channel_id = guild.id * 1000
+    for category_index in range(5):
+        channels = []
+        for index in range(11):
+            overwrites = {role: discord.PermissionOverwrite.from_pair(discord.Permissions(generator.getrandbits(64) & ALL_PERMISSIONS), discord.Permissions(generator.getrandbits(64) & ALL_PERMISSIONS)) for role in generator.sample(roles, min(len(roles), 3))}
+            channel_type = discord.ChannelType.category if index == 0 else discord.ChannelType.text
+            channels.append(FakeChannel(channel_id, "channel-" + str(category_index) + "-" + str(index), channel_type, overwrites))
+            channel_id += 1
+        guild.categories.append((channels[0], channels[1:]))
+    guild.member_count = member_count
+    guild.member_seed = generator.getrandbits(32)
+
+
+async def _noop_progress(done, total):
+    pass
+
+
+"""
+Runs the import code path of the !imports command: read the sheet, plan and run the operations.
+"""
+async def import_sheet(service, guild, spreadsheet_id, prune=False):
+    headings, rows = await open_sheet(service, spreadsheet_id)
+    checkpoint = new_checkpoint(spreadsheet_id, await plan_import(headings, rows, guild, prune=prune))
+    await run_import(guild, checkpoint, _noop_progress)
+    return len(checkpoint["operations"])
+
+
+def measure(name, role_count, sheets, guilds, scenario):
+    sheets_before = (sheets.requests, sheets.payload_bytes)
+    discord_before = sum(guild.requests for guild in guilds)
+    tracemalloc.start()
+    start = time.perf_counter()
+    scenario()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "scenario": name,
+        "roles": role_count,
+        "ms": round(elapsed * 1000, 2),
+        "sheets_requests": sheets.requests - sheets_before[0],
+        "payload_bytes": sheets.payload_bytes - sheets_before[1],
+        "discord_requests": sum(guild.requests for guild in guilds) - discord_before,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_scenarios(role_count, member_count, seed):
+    generator = random.Random(seed)
+    loop = asyncio.new_event_loop()
+    run = loop.run_until_complete
+    sheets = FakeSheets()
+    guild = synthetic_guild(1000 * role_count, role_count, generator)
+    empty_guild = synthetic_guild(1000 * role_count + 500, 2, generator)
+    add_channels_and_members(guild, member_count, generator)
+    guilds = [guild, empty_guild]
+    results = []
+
+    def edit_one_role():
+        role = guild.roles[len(guild.roles) // 2]
+        role.color = discord.Colour(role.color.value ^ 0xFFFFFF)  # A color always changes exactly one cell, unlike a permission of an administrator.
+        return run(export_guild(sheets, guild, SPREADSHEET_ID))
+
+    roles = guild.roles
+    results.append(measure("build_rows", role_count, sheets, guilds, lambda: build_rows([role.permissions.value for role in roles], [str(role.color) for role in roles])))
+    results.append(measure("export (first)", role_count, sheets, guilds, lambda: run(export_guild(sheets, guild, SPREADSHEET_ID))))
+    results.append(measure("export (unchanged)", role_count, sheets, guilds, lambda: run(export_guild(sheets, guild, SPREADSHEET_ID))))
+    results.append(measure("export (one role edited)", role_count, sheets, guilds, edit_one_role))
+    results.append(measure("export (full)", role_count, sheets, guilds, lambda: run(export_guild(sheets, guild, SPREADSHEET_ID, full=True))))
+    results.append(measure("export tabs (" + str(member_count) + " members)", role_count, sheets, guilds, lambda: run(export_tabs(sheets, guild, SPREADSHEET_ID))))
+    results.append(measure("import (unchanged)", role_count, sheets, guilds, lambda: run(import_sheet(sheets, guild, SPREADSHEET_ID))))
+    results.append(measure("import (into empty server)", role_count, sheets, guilds, lambda: run(import_sheet(sheets, empty_guild, SPREADSHEET_ID))))
+    loop.close()
+    return results
+
+
+"""
+What every scenario must do, as (description, check(result, role_count, member_count)) pairs.
+Synthetic servers hold @everyone, the BOT's managed role and role_count - 2 roles, so an import
+into an empty server creates role_count - 2 roles and reorders them once.
+"""
+EXPECTED = {
+    "export (first)": [("2 Sheets requests, the first sheet's size and the write", lambda result, roles, members: result["sheets_requests"] == 2)],
+    "export (unchanged)": [("no Sheets request", lambda result, roles, members: result["sheets_requests"] == 0)],
+    "export (one role edited)": [
+        ("1 Sheets request", lambda result, roles, members: result["sheets_requests"] == 1),
+        ("one changed cell sent", lambda result, roles, members: result["payload_bytes"] < 200),
+    ],
+    "export (full)": [("2 Sheets requests, the first sheet's size and the write", lambda result, roles, members: result["sheets_requests"] == 2)],
+    "export tabs": [
+        ("1 Discord request per 1000 members", lambda result, roles, members: result["discord_requests"] == math.ceil(members / 1000)),
+        ("writes of about MAX_REQUEST_BYTES", lambda result, roles, members: 3 <= result["sheets_requests"] <= 3 + result["payload_bytes"] // MAX_REQUEST_BYTES),
+    ],
+    "import (unchanged)": [
+        ("1 Sheets request per CHUNK_ROWS rows, after the size probe", lambda result, roles, members: result["sheets_requests"] == 1 + math.ceil(roles / CHUNK_ROWS)),
+        ("no Discord request", lambda result, roles, members: result["discord_requests"] == 0),
+    ],
+    "import (into empty server)": [("role_count - 2 creates and 1 reorder", lambda result, roles, members: result["discord_requests"] == roles - 1)],
+}
+
+
+"""
+Returns the failed expectations of a scenario's result, as messages.
+"""
+def check(result, member_count):
+    failures = []
+    for scenario, expectations in EXPECTED.items():
+        if result["scenario"].startswith(scenario):
+            for description, expectation in expectations:
+                if not expectation(result, result["roles"], member_count):
+                    failures.append(result["scenario"] + " with " + str(result["roles"]) + " roles: expected " + description + ", got " + json.dumps(result))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the export and import code paths against offline fakes.")
+    parser.add_argument("--roles", default="10,50,100,250", help="Comma separated role counts of the synthetic servers.")
+    parser.add_argument("--members", type=int, default=10000, help="Members of the synthetic servers, for the Members tab.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON lines instead of a table.")
+    arguments = parser.parse_args()
+
+    config_store.init(path.join(tempfile.mkdtemp(), "benchmark.db"))  # Keep the real database out of it.
+    sheets_client.use_limiter(LocalTokenBucket(10 ** 9))  # The fakes have no quota,
+    sheets_client.use_http(object)  # and need no connection, nor credentials.
+
+    failures = []
+    columns = ["scenario", "roles", "ms", "sheets_requests", "payload_bytes", "discord_requests", "peak_kib"]
+    if not arguments.json:
+        print("{:<28}{:>7}{:>11}{:>17}{:>15}{:>18}{:>11}".format(*columns))
+    for role_count in (int(count) for count in arguments.roles.split(",")):
+        for result in run_scenarios(role_count, arguments.members, arguments.seed):
+            failures += check(result, arguments.members)
+            if arguments.json:
+                print(json.dumps(result))
+            else:
+                print("{:<28}{:>7}{:>11}{:>17}{:>15}{:>18}{:>11}".format(*(result[column] for column in columns)))
+    for failure in failures:
+        print("FAILED: " + failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
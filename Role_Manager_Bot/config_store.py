@@ -0,0 +1,176 @@
+"""
+This file holds the configuration store of the BOT, replacing the old serverdata/<server ID>.txt files.
+Every server's spreadsheet ID and settings live in one SQLite database (serverdata/guilds.db),
+next to the snapshots of their last export and the checkpoints of unfinished imports.
+Lookups are served from an in-memory LRU cache that is warmed when the BOT starts
+and updated on every write, so commands do not touch the disk to read them.
+Snapshots and checkpoints, written on every export and import operation, are written by a
+single thread with its own connection, so waiting on another worker's lock never blocks the event loop.
+"""
+import asyncio
+import json
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir, path
+
+DATA_DIRECTORY = path.join(path.dirname(path.abspath(__file__)), "serverdata")
+DATABASE_PATH = path.join(DATA_DIRECTORY, "guilds.db")
+CACHE_SIZE = 10000  # Maximum amount of servers kept in memory.
+
+CONNECTION = None
+WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config_store")  # One thread, so the writes keep their order.
+_WRITER_CONNECTION = None  # Opened by the writer thread, which is the only one using it.
+_DATABASE_PATH = None
+CACHE = OrderedDict()  # Server ID -> {"spreadsheet_id": ..., "settings": {...}} or UNCONFIGURED, most recently used last.
+UNCONFIGURED = object()  # Cached for the servers that are not in the database, so that their commands and role events stay off the disk too.
+COMPLETE = False  # True while the cache holds every server of the database, so a server missing from it is not in the database either.
+
+
+"""
+Opens the database, creates its tables and imports the legacy serverdata/*.txt files
+of the servers that are not in it yet. Safe to call more than once.
+"""
+def init(database_path=DATABASE_PATH):
+    global CONNECTION, _DATABASE_PATH
+    if CONNECTION is not None:
+        return
+    _DATABASE_PATH = database_path
+    CONNECTION = sqlite3.connect(database_path, timeout=30)  # Worker processes (see launcher.py) share the database, so wait for each other's writes.
+    CONNECTION.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer, nor the other way around.
+    with CONNECTION:
+        CONNECTION.execute("CREATE TABLE IF NOT EXISTS guilds (guild_id INTEGER PRIMARY KEY, spreadsheet_id TEXT, settings TEXT NOT NULL DEFAULT '{}')")
+        CONNECTION.execute("CREATE TABLE IF NOT EXISTS snapshots (guild_id INTEGER PRIMARY KEY, spreadsheet_id TEXT NOT NULL, grid TEXT NOT NULL)")
+        CONNECTION.execute("CREATE TABLE IF NOT EXISTS checkpoints (guild_id INTEGER PRIMARY KEY, checkpoint TEXT NOT NULL)")
+    _import_legacy_files(path.dirname(database_path))
+
+
+def _import_legacy_files(directory):
+    with CONNECTION:
+        for file_name in listdir(directory):
+            guild_id = file_name[:-len(".txt")]
+            if not file_name.endswith(".txt") or not guild_id.isdigit():  # Only <server ID>.txt files hold a spreadsheet ID.
+                continue
+            with open(path.join(directory, file_name), "r") as server_file:
+                spreadsheet_id = server_file.read().strip()
+            if spreadsheet_id:
+                CONNECTION.execute("INSERT OR IGNORE INTO guilds (guild_id, spreadsheet_id) VALUES (?, ?)", (int(guild_id), spreadsheet_id))
+
+
+def _cache(guild_id, entry):
+    global COMPLETE
+    CACHE[guild_id] = entry
+    CACHE.move_to_end(guild_id)
+    if len(CACHE) > CACHE_SIZE:
+        CACHE.popitem(last=False)
+        COMPLETE = False
+
+
+"""
+Loads up to CACHE_SIZE servers into the cache, so that the first command of each one is served from memory.
+When that is every server of the database, the servers missing from the cache are known to be unconfigured.
+"""
+def warm():
+    global COMPLETE
+    rows = CONNECTION.execute("SELECT guild_id, spreadsheet_id, settings FROM guilds LIMIT ?", (CACHE_SIZE,)).fetchall()
+    for guild_id, spreadsheet_id, settings in rows:
+        _cache(guild_id, {"spreadsheet_id": spreadsheet_id, "settings": json.loads(settings)})
+    COMPLETE = len(rows) < CACHE_SIZE
+
+
+"""
+Returns the stored entry of a server, or None if it was never configured.
+"""
+def get(guild_id):
+    if guild_id in CACHE:
+        CACHE.move_to_end(guild_id)
+        entry = CACHE[guild_id]
+        return entry if entry is not UNCONFIGURED else None
+    if COMPLETE:
+        return None
+    row = CONNECTION.execute("SELECT spreadsheet_id, settings FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone()
+    if row is None:
+        _cache(guild_id, UNCONFIGURED)
+        return None
+    entry = {"spreadsheet_id": row[0], "settings": json.loads(row[1])}
+    _cache(guild_id, entry)
+    return entry
+
+
+def get_spreadsheet_id(guild_id):
+    entry = get(guild_id)
+    return entry["spreadsheet_id"] if entry is not None else None
+
+
+"""
+Links a server with a spreadsheet. Returns True if the server already had one, False if it is new.
+"""
+def set_spreadsheet_id(guild_id, spreadsheet_id):
+    entry = get(guild_id)
+    with CONNECTION:
+        CONNECTION.execute("INSERT INTO guilds (guild_id, spreadsheet_id) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET spreadsheet_id = excluded.spreadsheet_id", (guild_id, spreadsheet_id))
+    _cache(guild_id, {"spreadsheet_id": spreadsheet_id, "settings": entry["settings"] if entry is not None else {}})
+    return entry is not None and entry["spreadsheet_id"] is not None
+
+
+def get_setting(guild_id, name, default=None):
+    entry = get(guild_id)
+    return entry["settings"].get(name, default) if entry is not None else default
+
+
+def set_setting(guild_id, name, value):
+    entry = get(guild_id) or {"spreadsheet_id": None, "settings": {}}
+    settings = dict(entry["settings"], **{name: value})
+    with CONNECTION:
+        CONNECTION.execute("INSERT INTO guilds (guild_id, settings) VALUES (?, ?) ON CONFLICT(guild_id) DO UPDATE SET settings = excluded.settings", (guild_id, json.dumps(settings)))
+    _cache(guild_id, {"spreadsheet_id": entry["spreadsheet_id"], "settings": settings})
+
+
+"""
+Returns the snapshot of the last export as a (spreadsheet ID, grid) tuple,
+or (None, None) if the server has never been exported.
+"""
+def load_snapshot(guild_id):
+    row = CONNECTION.execute("SELECT spreadsheet_id, grid FROM snapshots WHERE guild_id = ?", (guild_id,)).fetchone()
+    if row is None:
+        return None, None
+    return row[0], json.loads(row[1])
+
+
+async def save_snapshot(guild_id, spreadsheet_id, grid):
+    await _write("INSERT OR REPLACE INTO snapshots (guild_id, spreadsheet_id, grid) VALUES (?, ?, ?)", (guild_id, spreadsheet_id, json.dumps(grid, ensure_ascii=False)))
+
+
+async def delete_snapshot(guild_id):
+    await _write("DELETE FROM snapshots WHERE guild_id = ?", (guild_id,))
+
+
+"""
+Returns the checkpoint of the server's unfinished import, or None if there is none.
+"""
+def load_checkpoint(guild_id):
+    row = CONNECTION.execute("SELECT checkpoint FROM checkpoints WHERE guild_id = ?", (guild_id,)).fetchone()
+    return json.loads(row[0]) if row is not None else None
+
+
+async def save_checkpoint(guild_id, checkpoint):
+    await _write("INSERT OR REPLACE INTO checkpoints (guild_id, checkpoint) VALUES (?, ?)", (guild_id, json.dumps(checkpoint, ensure_ascii=False)))  # Serialized now, while the checkpoint is in this state.
+
+
+async def clear_checkpoint(guild_id):
+    await _write("DELETE FROM checkpoints WHERE guild_id = ?", (guild_id,))
+
+
+"""
+Runs one write statement on the writer thread, which may wait up to 30 seconds for another worker's lock.
+"""
+async def _write(statement, parameters):
+    await asyncio.get_running_loop().run_in_executor(WRITER, _execute_write, statement, parameters)
+
+
+def _execute_write(statement, parameters):
+    global _WRITER_CONNECTION
+    if _WRITER_CONNECTION is None:
+        _WRITER_CONNECTION = sqlite3.connect(_DATABASE_PATH, timeout=30)
+    with _WRITER_CONNECTION:
+        _WRITER_CONNECTION.execute(statement, parameters)
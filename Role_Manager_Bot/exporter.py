@@ -0,0 +1,74 @@
+"""
+This file holds the export pipeline shared by the !export command and the live sync.
+It builds the grid of a server's roles and permissions and writes it to the
+server's Google Sheet, sending only the cells that changed since the last export.
+"""
+import asyncio
+from collections import defaultdict
+
+from request_data import *
+from permission_codec import PERMISSION_NAMES
+from config_store import load_snapshot, save_snapshot
+import sheets_client
+import metrics
+
+MAX_DIFF_RANGES = 100  # Above this many changed ranges, rewriting the whole grid is cheaper than sending the diff.
+
+EXPORT_LOCKS = defaultdict(asyncio.Lock)  # One export at a time per server, so that snapshots stay consistent.
+
+
+"""
+Builds the grid of the whole sheet from the roles of a server:
+the permission names on the first row and one row per role, in the order roles appear in Discord.
+The last column holds the ID of each role.
+"""
+def role_grid(guild):
+    role_list = list(reversed(guild.roles))  # Export all the roles from a server, in the order they appear in Discord.
+    role_names = [role.name for role in role_list]
+    permission_names = PERMISSION_NAMES + ["Color"]  # Add a Color column
+    permission_values = build_rows([role.permissions.value for role in role_list], [str(role.color) for role in role_list])  # Convert the permission bitfields to √ or X.
+    grid = build_grid(role_names, permission_names, permission_values)
+    grid[0].append("ID")  # Add an ID column, so that !imports recognises renamed roles. It can be hidden in the sheet.
+    for row, role in zip(grid[1:], role_list):
+        row.append(str(role.id))
+    return grid
+
+
+"""
+Returns the sheetId and (rows, columns) size of the first sheet of a spreadsheet, the one the roles are exported to.
+"""
+async def first_sheet(service, spreadsheet_id):
+    metadata_request = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,gridProperties(rowCount,columnCount))")
+    properties = (await sheets_client.execute(metadata_request))["sheets"][0]["properties"]
+    grid_properties = properties.get("gridProperties", {})
+    return properties["sheetId"], (grid_properties.get("rowCount", 0), grid_properties.get("columnCount", 0))
+
+
+"""
+Exports the roles of a server to its Google Sheet and returns the number of requests sent.
+The whole sheet is blanked and rewritten on the first export, when a different sheet was linked,
+when the diff would be too large or when full is True, so that nothing written by hand is left behind.
+Otherwise only the changed cells are sent.
+"""
+async def export_guild(service, guild, spreadsheet_id, full=False):
+    async with EXPORT_LOCKS[guild.id]:
+        with metrics.timer("stage_seconds", stage="export.build"):
+            grid = role_grid(guild)  # The whole sheet as one block.
+        with metrics.timer("stage_seconds", stage="export.diff"):
+            previous_id, previous_grid = load_snapshot(guild.id)  # The grid of the last export, if there is one.
+            if previous_id != spreadsheet_id:  # A different sheet was linked, so the snapshot says nothing about it.
+                previous_grid = None
+            ranges = changed_ranges(previous_grid, grid) if previous_grid and not full else None
+        with metrics.timer("stage_seconds", stage="export.write"):
+            requests_sent = 0
+            if ranges is None or len(ranges) > MAX_DIFF_RANGES:  # Blank the whole sheet and rewrite the grid, in one request.
+                sheet_id, sheet_size = await first_sheet(service, spreadsheet_id)
+                export_request = service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=export_request_body(sheet_id, grid, sheet_size))
+                await sheets_client.execute(export_request)  # Handling and execution of the request to the Google API. See request_data.py for more info.
+                requests_sent += 2
+            elif ranges:  # Only send the cells that changed since the last export.
+                diff_request = service.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=diff_request_body(ranges))
+                await sheets_client.execute(diff_request)
+                requests_sent += 1
+        await save_snapshot(guild.id, spreadsheet_id, grid)
+        return requests_sent
@@ -0,0 +1,282 @@
+"""
+This file holds the import executor used by the !imports command.
+The sheet is turned into a plan of create, edit and reorder operations up front,
+which then runs under a rate-limit-aware scheduler. Every finished operation is saved
+in a checkpoint (see config_store.py), so an import that stopped halfway resumes where it stopped.
+"""
+import asyncio
+import hashlib
+import json
+import time
+
+import discord
+
+import config_store
+import metrics
+from permission_codec import effective_permissions, parse_permissions, permission_columns
+
+CONCURRENCY = 3  # Operations running against Discord at the same time.
+MAX_RETRIES = 5  # Attempts per operation when Discord keeps rate limiting it.
+PROGRESS_INTERVAL = 2  # Seconds between two edits of the progress message.
+MAX_NAME_LENGTH = 100  # Discord's limit for role names.
+
+
+"""
+Reads the permissions and the color of a role from its sheet row.
+columns comes from permission_columns(headings) and color_column is the index of the Color column, or None.
+Missing cells are read as denied permissions, and a missing or invalid color as the default color.
+"""
+def parse_row(columns, color_column, row):
+    perms = discord.Permissions(parse_permissions(columns, row))
+    clr = None
+    if color_column is not None and color_column < len(row) and row[color_column] != "":
+        try:
+            clr = discord.Colour.from_str(row[color_column])
+        except ValueError:
+            clr = None
+    return perms, clr
+
+
+"""
+Plans the minimal set of operations that brings the server in line with the sheet.
+Operations are JSON-friendly dicts, so that they can be saved in a checkpoint:
+    {"type": "create", "name": ..., "permissions": ..., "color": ...}
+    {"type": "edit", "role_id": ..., and only the fields that differ: "name", "permissions", "color"}
+    {"type": "delete", "role_id": ...}  (only when prune is True)
+    {"type": "reorder", "order": [{"id": ...} or {"name": ...}, ...]}  (top to bottom)
+Sheet rows are matched to roles by the ID column when there is one, and otherwise by name, to a role no other row matched.
+Roles the BOT cannot manage (managed roles and roles above its own) are left as they are.
+
+rows is an async iterable of the rows below the headings (see sheet_reader.py), processed as they arrive.
+Returns the plan: {"operations": [...], "sheet": fingerprint of the sheet, "prune": prune, "skipped": [invalid role names]}.
+The fingerprint tells whether a checkpoint was made from the same sheet.
+"""
+async def plan_import(headings, rows, guild, prune=False):
+    top_role = guild.me.top_role
+    roles_by_id = {role.id: role for role in guild.roles}
+    roles_by_name = {}  # Name -> the roles of that name, bottom to top.
+    for role in guild.roles:
+        roles_by_name.setdefault(role.name, []).append(role)
+    id_column = headings.index("ID") if "ID" in headings else None
+    color_column = headings.index("Color") if "Color" in headings else None
+    columns = permission_columns(headings)  # Built once for the whole sheet.
+
+    fingerprint = hashlib.sha1(json.dumps(headings, ensure_ascii=False).encode("utf-8"))
+    operations = []
+    skipped = []
+    matched = set()  # IDs of the roles that have a row in the sheet.
+    created = set()  # Names of the roles that will be created.
+    order = []  # Rows of the sheet, top to bottom, as references to their roles.
+    async for row in rows:
+        fingerprint.update(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        name = row[0].strip() if row else ""
+        if name == "":
+            continue
+        if len(name) > MAX_NAME_LENGTH:
+            skipped.append(name)
+            continue
+        role_id = row[id_column] if id_column is not None and id_column < len(row) else ""
+        role = roles_by_id.get(int(role_id)) if role_id.isdigit() else None
+        if role is not None and role.id in matched:  # A second row for the same role, the first one wins.
+            continue
+        if role is None:  # Only a role no other row matched, otherwise the row is a new role of the same name.
+            role = next((named for named in roles_by_name.get(name, ()) if named.id not in matched), None)
+        perms, clr = parse_row(columns, color_column, row)
+        clr = clr.value if clr is not None else 0
+        if role is None:
+            if name not in created:
+                created.add(name)
+                operations.append({"type": "create", "name": name, "permissions": perms.value, "color": clr})
+                order.append({"name": name})
+            continue
+        matched.add(role.id)
+        if role.is_default():  # Only the permissions of @everyone can change.
+            if effective_permissions(role.permissions.value) != effective_permissions(perms.value):
+                operations.append({"type": "edit", "role_id": role.id, "permissions": perms.value})
+            continue
+        order.append({"id": role.id})
+        if role.managed or role >= top_role:
+            continue
+        changes = {}
+        if role.name != name:
+            changes["name"] = name
+        if effective_permissions(role.permissions.value) != effective_permissions(perms.value):  # Administrators are exported with every permission ticked.
+            changes["permissions"] = perms.value
+        if role.color.value != clr:
+            changes["color"] = clr
+        if changes:
+            operations.append(dict({"type": "edit", "role_id": role.id}, **changes))
+
+    manageable = [role for role in reversed(guild.roles) if not role.is_default() and role < top_role]  # Top to bottom.
+    if prune:
+        for role in manageable:
+            if role.id not in matched and not role.managed:
+                operations.append({"type": "delete", "role_id": role.id})
+        manageable = [role for role in manageable if role.id in matched or role.managed]
+    new_order = _merge_order(manageable, order, matched)
+    if created or new_order != [{"id": role.id} for role in manageable]:
+        operations.append({"type": "reorder", "order": new_order})
+    return {"operations": operations, "sheet": fingerprint.hexdigest(), "prune": prune, "skipped": skipped}
+
+
+"""
+Returns the new top to bottom order of the roles the BOT can move.
+Roles in the sheet follow the order of the sheet; roles that are not in it
+stay right below the role they currently follow, so they move as little as possible.
+"""
+def _merge_order(manageable, order, matched):
+    movable = {role.id for role in manageable}
+    followers = {None: []}  # Role ID -> roles that are not in the sheet and currently sit right below it.
+    previous = None
+    for role in manageable:
+        if role.id in matched:
+            previous = role.id
+            followers.setdefault(previous, [])
+        else:
+            followers.setdefault(previous, []).append({"id": role.id})
+    new_order = list(followers[None])
+    for reference in order:
+        if "name" in reference:  # A role that will be created.
+            new_order.append(reference)
+        elif reference["id"] in movable:
+            new_order.append(reference)
+            new_order += followers[reference["id"]]
+    return new_order
+
+
+def new_checkpoint(spreadsheet_id, plan):
+    return {"spreadsheet_id": spreadsheet_id, "sheet": plan["sheet"], "prune": plan["prune"], "operations": plan["operations"], "done": [], "created": {}, "creating": {}}
+
+
+"""
+Returns the saved checkpoint of the server if it was made from the same sheet and mode, and the operations
+it has left are the ones the fresh plan would run, so that the import resumes.
+Otherwise the checkpoint is thrown away: the sheet, the mode (prune) or the roles changed since it was saved,
+e.g. a role was edited or deleted by hand, and the fresh plan is the one that matches the server.
+"""
+def resume_checkpoint(guild_id, spreadsheet_id, plan):
+    checkpoint = config_store.load_checkpoint(guild_id)
+    if checkpoint is None or checkpoint["spreadsheet_id"] != spreadsheet_id or checkpoint["sheet"] != plan["sheet"] or checkpoint.get("prune") != plan["prune"]:
+        return None
+    done = set(checkpoint["done"])
+    left = [operation for index, operation in enumerate(checkpoint["operations"]) if index not in done]
+    if left != json.loads(json.dumps(plan["operations"])):  # The same operations as they are saved.
+        return None
+    return checkpoint
+
+
+"""
+Runs one operation, waiting out Discord's rate limits using the reset time it sends back.
+discord.py already waits for its own buckets; this only covers the requests it gives up on.
+Before a create is sent, the checkpoint saves the IDs of the roles that already have its name. If the import stopped
+after Discord created the role but before the checkpoint was saved, the create is not run again: the role of that name
+that was not there before is the one it created. Roles that merely share the name are never taken for it.
+"""
+async def _run_operation(guild, operation, checkpoint):
+    created = checkpoint["created"]
+    if operation["type"] == "create":
+        creating = checkpoint.setdefault("creating", {})  # Checkpoints saved before creates were recorded have none.
+        if operation["name"] in creating:
+            role = next((role for role in guild.roles if role.name == operation["name"] and role.id not in creating[operation["name"]]), None)
+            if role is not None:
+                created[operation["name"]] = role.id
+                del creating[operation["name"]]
+                return
+        creating[operation["name"]] = [role.id for role in guild.roles if role.name == operation["name"]]
+        await config_store.save_checkpoint(guild.id, checkpoint)
+    for attempt in range(MAX_RETRIES):
+        metrics.increment("discord_requests_total", operation=operation["type"])
+        try:
+            if operation["type"] == "create":
+                role = await guild.create_role(name=operation["name"], permissions=discord.Permissions(operation["permissions"]), color=discord.Colour(operation["color"]))
+                created[operation["name"]] = role.id
+                del checkpoint["creating"][operation["name"]]
+            elif operation["type"] == "edit":
+                role = guild.get_role(operation["role_id"])
+                if role is not None:
+                    await role.edit(**_edit_fields(operation))
+            elif operation["type"] == "delete":
+                role = guild.get_role(operation["role_id"])
+                if role is not None:
+                    await role.delete()
+            elif operation["type"] == "reorder":
+                positions = _positions(guild, operation["order"], created)
+                if positions:
+                    await guild.edit_role_positions(positions)
+            return
+        except discord.RateLimited as exception:
+            retry_after = exception.retry_after
+        except discord.HTTPException as exception:
+            if exception.status != 429 or attempt == MAX_RETRIES - 1:
+                raise
+            headers = exception.response.headers
+            retry_after = float(headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 2 ** attempt)
+        metrics.increment("discord_rate_limits_total", scope="import")
+        metrics.observe("discord_rate_limit_wait_seconds", retry_after)
+        await asyncio.sleep(retry_after)
+    raise RuntimeError("Gave up on " + operation["type"] + " after " + str(MAX_RETRIES) + " rate limited attempts.")
+
+
+def _edit_fields(operation):
+    fields = {}
+    if "name" in operation:
+        fields["name"] = operation["name"]
+    if "permissions" in operation:
+        fields["permissions"] = discord.Permissions(operation["permissions"])
+    if "color" in operation:
+        fields["color"] = discord.Colour(operation["color"])
+    return fields
+
+
+"""
+Turns the top to bottom order of the sheet into the role positions Discord expects.
+Roles that cannot be found (or @everyone, which always stays at the bottom) are skipped.
+"""
+def _positions(guild, order, created):
+    roles = []
+    for reference in order:
+        role_id = reference["id"] if "id" in reference else created.get(reference["name"])
+        role = guild.get_role(role_id) if role_id is not None else None
+        if role is not None and not role.is_default():
+            roles.append(role)
+    return {role: len(roles) - index for index, role in enumerate(roles)}
+
+
+"""
+Runs the operations of the checkpoint that are not done yet and saves the checkpoint after each one.
+Creates, edits and deletes run CONCURRENCY at a time; reorders run alone, once everything else is done.
+If one of them fails, the others are cancelled and waited for before the error is raised,
+so nothing keeps changing the server or the checkpoint once the import has stopped.
+on_progress(done, total) is awaited at most every PROGRESS_INTERVAL seconds and once at the end.
+"""
+async def run_import(guild, checkpoint, on_progress):
+    operations = checkpoint["operations"]
+    done = set(checkpoint["done"])
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    last_progress = 0
+
+    async def run(index):
+        nonlocal last_progress
+        async with semaphore:
+            await _run_operation(guild, operations[index], checkpoint)
+            done.add(index)
+            checkpoint["done"] = sorted(done)
+            await config_store.save_checkpoint(guild.id, checkpoint)
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                await on_progress(len(done), len(operations))
+
+    pending = [index for index in range(len(operations)) if index not in done and operations[index]["type"] != "reorder"]
+    tasks = [asyncio.create_task(run(index)) for index in pending]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    for index in range(len(operations)):
+        if index not in done and operations[index]["type"] == "reorder":
+            await run(index)
+    await config_store.clear_checkpoint(guild.id)
+    await on_progress(len(done), len(operations))
@@ -0,0 +1,137 @@
+"""
+This file holds the job queue of the BOT. !export, !imports and the live sync submit their work here
+instead of running it right away, so that:
+- a server runs one job at a time, in order, so imports and exports never interleave their writes,
+- an export submitted while another export of the same server is the last job waiting is merged into it,
+- servers take turns (round-robin) and at most MAX_RUNNING_JOBS jobs run at the same time,
+so one busy server cannot hold the others back.
+"""
+import asyncio
+import time
+from collections import deque
+
+import metrics
+
+MAX_RUNNING_JOBS = 4  # Jobs running at the same time, across every server of the process.
+
+QUEUES = {}  # Server ID -> deque of its waiting jobs, oldest first.
+RUNNING = {}  # Server ID -> its running job.
+READY = deque()  # IDs of the servers with waiting jobs and nothing running, in the order they take their turn.
+LAST = {}  # Server ID -> {"kind": ..., "seconds": ..., "failed": ...} of its last finished job.
+
+
+"""
+A job of a server. run is the coroutine function that does the work, called as run(**options).
+Every caller of a merged job awaits the same future, through asyncio.shield(), so that a caller
+that is cancelled does not cancel the job of the others.
+"""
+class Job:
+    def __init__(self, guild_id, kind, run, options):
+        self.guild_id = guild_id
+        self.kind = kind
+        self.run = run
+        self.options = options
+        self.future = asyncio.get_running_loop().create_future()
+        self.submitted = time.monotonic()
+        self.started = None
+        self.task = None
+
+
+"""
+Adds a job to its server's queue and returns it; await asyncio.shield(job.future) for its result.
+With coalesce, the server's last waiting job takes the new one in instead if it is of the same kind:
+it runs with the latest run and options, where true options win (e.g. full=True), and the existing job is returned.
+A job waiting ahead of other jobs (e.g. an export before an import) is never merged into,
+since it would finish before the jobs the new one was submitted after.
+"""
+def submit(guild_id, kind, run, coalesce=False, **options):
+    waiting = QUEUES.get(guild_id)
+    if coalesce and waiting and waiting[-1].kind == kind:
+        job = waiting[-1]
+        job.run = run
+        job.options = {name: job.options.get(name) or value for name, value in options.items()}
+        metrics.increment("jobs_coalesced_total", kind=kind)
+        return job
+    job = Job(guild_id, kind, run, options)
+    if waiting is None:
+        waiting = QUEUES[guild_id] = deque()
+        if guild_id not in RUNNING:
+            READY.append(guild_id)
+    waiting.append(job)
+    metrics.increment("jobs_total", kind=kind)
+    _dispatch()
+    return job
+
+
+"""
+Starts the jobs of the servers whose turn it is, as long as fewer than MAX_RUNNING_JOBS are running.
+"""
+def _dispatch():
+    while READY and len(RUNNING) < MAX_RUNNING_JOBS:
+        guild_id = READY.popleft()
+        job = QUEUES[guild_id].popleft()
+        if not QUEUES[guild_id]:
+            del QUEUES[guild_id]
+        RUNNING[guild_id] = job
+        job.started = time.monotonic()
+        metrics.observe("job_wait_seconds", job.started - job.submitted, kind=job.kind)
+        job.task = asyncio.create_task(_run(job))
+        job.task.add_done_callback(lambda task, job=job: _finish(job))  # Also called when the task is cancelled before it starts.
+    metrics.set_gauge("jobs_running", len(RUNNING))
+    metrics.set_gauge("jobs_waiting", sum(len(waiting) for waiting in QUEUES.values()))
+
+
+async def _run(job):
+    try:
+        result = await job.run(**job.options)
+        if not job.future.done():  # A caller may have cancelled it without shielding it.
+            job.future.set_result(result)
+    except Exception as exception:  # Recorded by whoever awaits the job, like any other error of theirs.
+        if not job.future.done():
+            job.future.set_exception(exception)
+
+
+"""
+Called once the job's task is done, however it ended. A cancelled job cancels its future,
+so that its callers stop waiting, and the server's next job gets its turn.
+"""
+def _finish(job):
+    if not job.future.done():
+        job.future.cancel()
+    failed = job.future.cancelled() or job.future.exception() is not None
+    if failed:
+        metrics.increment("jobs_failed_total", kind=job.kind)
+    seconds = time.monotonic() - job.started
+    metrics.observe("job_seconds", seconds, kind=job.kind)
+    LAST[job.guild_id] = {"kind": job.kind, "seconds": seconds, "failed": failed}
+    del RUNNING[job.guild_id]
+    if job.guild_id in QUEUES:  # The server's next job waits for its next turn, behind the other servers.
+        READY.append(job.guild_id)
+    _dispatch()
+
+
+"""
+Returns how many jobs have to finish before the job starts: the ones ahead of it in its server's queue,
+including the running one, and one per server that takes its turn first. 0 once it is running.
+"""
+def position(job):
+    if RUNNING.get(job.guild_id) is job:
+        return 0
+    waiting = QUEUES.get(job.guild_id, ())
+    ahead = list(waiting).index(job) if job in waiting else 0
+    if job.guild_id in RUNNING:
+        return ahead + 1
+    servers_ahead = list(READY).index(job.guild_id) if job.guild_id in READY else 0
+    return ahead + servers_ahead + (1 if len(RUNNING) >= MAX_RUNNING_JOBS else 0)
+
+
+"""
+Returns the state of a server's jobs for !status: the running job, the waiting ones and the last finished one.
+"""
+def status(guild_id):
+    running = RUNNING.get(guild_id)
+    return {
+        "running": {"kind": running.kind, "seconds": time.monotonic() - running.started} if running is not None else None,
+        "waiting": [{"kind": job.kind, "position": position(job)} for job in QUEUES.get(guild_id, ())],
+        "last": LAST.get(guild_id),
+    }
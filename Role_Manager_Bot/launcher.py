@@ -0,0 +1,68 @@
+"""
+This file starts the BOT as several worker processes, each one running role_manager.py
+for its own range of shards. Every worker shares the configuration database in serverdata
+and one Google Sheets quota budget (see quota.py), so adding processes never adds quota.
+Workers that stop are restarted.
+
+Usage: python launcher.py --processes 4 --shards 16 [--metrics-port 9100]
+With --metrics-port, worker N serves its metrics on port + N.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from os import path
+
+BOT_DIRECTORY = path.dirname(path.abspath(__file__))
+QUOTA_FILE = path.join(BOT_DIRECTORY, "serverdata", "sheets_quota.json")
+RESTART_DELAY = 5  # Seconds before a stopped worker is started again.
+
+
+"""
+Splits the shards into one contiguous range per process, e.g. 10 shards on 3 processes: 0-3, 4-6, 7-9.
+"""
+def shard_ranges(shard_count, process_count):
+    ranges = []
+    start = 0
+    for index in range(process_count):
+        size = shard_count // process_count + (1 if index < shard_count % process_count else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return [shard_ids for shard_ids in ranges if shard_ids]
+
+
+def start_worker(index, shard_count, shard_ids, metrics_port):
+    environment = dict(os.environ, SHARD_COUNT=str(shard_count), SHARD_IDS=",".join(str(shard_id) for shard_id in shard_ids), QUOTA_FILE=QUOTA_FILE)
+    if metrics_port:
+        environment["METRICS_PORT"] = str(metrics_port + index)
+    print("Starting worker " + str(index) + " with shards " + environment["SHARD_IDS"] + " of " + str(shard_count))
+    return subprocess.Popen([sys.executable, path.join(BOT_DIRECTORY, "role_manager.py")], cwd=BOT_DIRECTORY, env=environment)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the BOT as several worker processes, each with a range of shards.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, help="Total amount of shards. Defaults to one per process.")
+    parser.add_argument("--metrics-port", type=int, help="First port of the workers' /metrics endpoints.")
+    arguments = parser.parse_args()
+
+    shard_count = arguments.shards or arguments.processes
+    ranges = shard_ranges(shard_count, arguments.processes)
+    workers = [start_worker(index, shard_count, shard_ids, arguments.metrics_port) for index, shard_ids in enumerate(ranges)]
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            for index, worker in enumerate(workers):
+                if worker.poll() is not None:  # The worker stopped, start it again.
+                    print("Worker " + str(index) + " exited with code " + str(worker.returncode) + ", restarting it.")
+                    workers[index] = start_worker(index, shard_count, ranges[index], arguments.metrics_port)
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+This file holds the live sync, an opt-in mode that keeps a server's Google Sheet
+up to date without !export. Role events only mark the server as changed; the
+changes are debounced and coalesced into one export, so reordering 100 roles
+produces one batched write instead of 100.
+"""
+import asyncio
+import time
+
+import config_store
+import metrics
+
+DEBOUNCE_SECONDS = 10  # Quiet time after the last role event before the sheet is written.
+MAX_DELAY_SECONDS = 60  # Longest a change may wait while role events keep coming in.
+
+PENDING = {}  # Server ID -> {"roles": changed role IDs, "first": time of the first event, "last": time of the last event}
+TASKS = {}  # Server ID -> task waiting to flush that server's pending changes.
+_EXPORT = None
+
+
+"""
+Registers the coroutine that writes a server's sheet, called as export(guild, role_ids).
+"""
+def init(export):
+    global _EXPORT
+    _EXPORT = export
+
+
+def is_enabled(guild_id):
+    return config_store.get_setting(guild_id, "live_sync", False)
+
+
+def set_enabled(guild_id, enabled):
+    config_store.set_setting(guild_id, "live_sync", enabled)
+    if not enabled:
+        PENDING.pop(guild_id, None)
+
+
+"""
+Adds a changed role to its server's queue and makes sure a flush is scheduled.
+Does nothing for servers that did not turn the live sync on.
+"""
+def queue(guild, role_id):
+    if not is_enabled(guild.id):
+        return
+    now = time.monotonic()
+    pending = PENDING.setdefault(guild.id, {"roles": set(), "first": now, "last": now})
+    pending["roles"].add(role_id)
+    pending["last"] = now
+    if guild.id not in TASKS:
+        TASKS[guild.id] = asyncio.create_task(_flush(guild))
+
+
+"""
+Waits until the server has been quiet for DEBOUNCE_SECONDS (or MAX_DELAY_SECONDS have passed
+since its first change) and exports it once. Changes made during the export are flushed by a new task.
+"""
+async def _flush(guild):
+    try:
+        while guild.id in PENDING:
+            pending = PENDING[guild.id]
+            remaining = min(pending["last"] + DEBOUNCE_SECONDS, pending["first"] + MAX_DELAY_SECONDS) - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        pending = PENDING.pop(guild.id, None)
+        if pending is not None:
+            metrics.increment("live_sync_flushes_total")
+            metrics.increment("live_sync_events_coalesced_total", len(pending["roles"]))
+            with metrics.timer("command_seconds", command="livesync.flush"):
+                await _EXPORT(guild, pending["roles"])
+    except Exception as exception:
+        metrics.record_error("live_sync", guild.id, exception)
+    finally:
+        del TASKS[guild.id]
+        if guild.id in PENDING:  # Role events arrived while the sheet was being written.
+            TASKS[guild.id] = asyncio.create_task(_flush(guild))
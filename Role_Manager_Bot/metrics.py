@@ -0,0 +1,162 @@
+"""
+This file holds the instrumentation of the BOT: counters, gauges and timings of the commands,
+of their stages, of the Google Sheets requests and of Discord's rate limits.
+They are exposed in the Prometheus text format on an HTTP endpoint (METRICS_PORT environment variable)
+and/or written to the log every METRICS_LOG_INTERVAL seconds.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+PREFIX = "role_manager_"
+
+LOG = logging.getLogger("role_manager")
+STARTED = []  # What start() started: the rate limit handler, the endpoint's runner and the log task.
+COUNTERS = {}  # (name, labels) -> value
+GAUGES = {}  # (name, labels) -> value
+TIMINGS = {}  # (name, labels) -> [count, sum of seconds, max seconds]
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    COUNTERS[key] = COUNTERS.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    GAUGES[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    timing = TIMINGS.setdefault(_key(name, labels), [0, 0.0, 0.0])
+    timing[0] += 1
+    timing[1] += seconds
+    timing[2] = max(timing[2], seconds)
+
+
+"""
+Times the block it wraps, e.g. with timer("stage_seconds", stage="export.write"):
+The time is recorded even if the block raises.
+"""
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+"""
+Logs an exception raised while handling a server, with its traceback, and counts it per server.
+"""
+def record_error(source, guild_id, exception):
+    increment("errors_total", source=source, guild=guild_id)
+    LOG.error("%s failed for server %s: %r", source, guild_id, exception, exc_info=exception)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(label + '="' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for label, value in labels) + "}"
+
+
+"""
+Renders every metric in the Prometheus text exposition format.
+Timings are rendered as summaries (_count and _sum) with an extra _max gauge.
+"""
+def render():
+    lines = []
+    for (name, labels), value in sorted(COUNTERS.items()):
+        lines.append(PREFIX + name + _labels(labels) + " " + str(value))
+    for (name, labels), value in sorted(GAUGES.items()):
+        lines.append(PREFIX + name + _labels(labels) + " " + str(value))
+    for (name, labels), (count, total, maximum) in sorted(TIMINGS.items()):
+        lines.append(PREFIX + name + "_count" + _labels(labels) + " " + str(count))
+        lines.append(PREFIX + name + "_sum" + _labels(labels) + " " + repr(round(total, 6)))
+        lines.append(PREFIX + name + "_max" + _labels(labels) + " " + repr(round(maximum, 6)))
+    return "\n".join(lines) + "\n"
+
+
+"""
+Counts the rate limits discord.py waits out by itself, which it only reports through its log.
+Every 429 logs "We are being rate limited... Retrying in", and a global one logs "Global rate limit
+has been hit. Retrying in" right after it, in the same step of the event loop. So each 429 is counted
+once, from the first message, on the next step, with the scope the second message may have set.
+"""
+class RateLimitHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.pending = None  # The last 429 seen, until it is counted.
+
+    def emit(self, record):
+        message = str(record.msg)
+        if record.levelno != logging.WARNING or "Retrying in" not in message or not record.args:
+            return
+        if message.startswith("Global rate limit"):
+            if self.pending is not None:
+                self.pending["scope"] = "global"
+            return
+        self.pending = {"scope": "route", "seconds": float(record.args[-1])}
+        try:
+            asyncio.get_running_loop().call_soon(self._count, self.pending)
+        except RuntimeError:  # Not on the event loop, so there is no second message to wait for.
+            self._count(self.pending)
+
+    def _count(self, rate_limit):
+        increment("discord_rate_limits_total", scope=rate_limit["scope"])
+        observe("discord_rate_limit_wait_seconds", rate_limit["seconds"])
+        if self.pending is rate_limit:
+            self.pending = None
+
+
+def install_rate_limit_handler():
+    handler = RateLimitHandler()
+    logging.getLogger("discord.http").addHandler(handler)
+    return handler
+
+
+async def _handle_metrics(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+"""
+Starts the /metrics HTTP endpoint on the given port, on the BOT's event loop.
+"""
+async def serve(port):
+    application = web.Application()
+    application.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    LOG.info("Metrics endpoint listening on port %s", port)
+    return runner
+
+
+"""
+Writes a snapshot of every metric to the log every interval seconds, forever.
+"""
+async def log_snapshots(interval):
+    while True:
+        await asyncio.sleep(interval)
+        LOG.info("Metrics snapshot:\n%s", render())
+
+
+"""
+Starts the instrumentation once, however many times the BOT reconnects.
+port starts the /metrics endpoint and interval the log snapshots; either can be None to leave it off.
+"""
+async def start(port=None, interval=None):
+    if STARTED:
+        return
+    STARTED.append(install_rate_limit_handler())
+    if port:
+        STARTED.append(await serve(int(port)))
+    if interval:
+        STARTED.append(asyncio.create_task(log_snapshots(int(interval))))
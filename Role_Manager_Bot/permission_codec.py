@@ -0,0 +1,70 @@
+"""
+This file holds the conversion between a role's permissions and its cells in the sheet.
+It works directly on the integer bitfield of discord.Permissions, using a table of
+permission columns and bits built once from discord.Permissions.VALID_FLAGS,
+so new Discord permissions show up in the sheet without any change here.
+"""
+from functools import lru_cache
+
+import discord
+
+ALLOWED = "✔️"
+DENIED = "❌"
+TRUE_CELLS = {"✔️", "✔", "✅", "true", "yes", "1"}  # Cells read as an allowed permission, in lowercase. Anything else, "❌" and "X" included, is denied.
+
+PERMISSION_NAMES = [name for name, _ in discord.Permissions.none()]  # The permission columns of the sheet, without aliases, in Discord's order.
+PERMISSION_BITS = [discord.Permissions.VALID_FLAGS[name] for name in PERMISSION_NAMES]
+FLAG_BITS = dict(discord.Permissions.VALID_FLAGS)  # Every permission name, aliases included, and its bit. Used to read the headings of a sheet.
+ADMINISTRATOR = discord.Permissions.administrator.flag
+ALL_PERMISSIONS = sum(PERMISSION_BITS)
+
+
+"""
+Returns the permissions a value effectively grants: all of them for administrators.
+"""
+def effective_permissions(value):
+    return ALL_PERMISSIONS if value & ADMINISTRATOR else value
+
+
+"""
+Returns the cells of a permission value, one per PERMISSION_NAMES column.
+Administrators get ✔ on every column. Cached, since most roles of a server share a handful of values.
+"""
+@lru_cache(maxsize=4096)
+def render_permissions(value):
+    value = effective_permissions(value)
+    return tuple(ALLOWED if value & bit else DENIED for bit in PERMISSION_BITS)
+
+
+def render_rows(values):
+    return [list(render_permissions(value)) for value in values]
+
+
+"""
+Returns the cell of a channel's permission overwrite for a role: the allowed permissions after ✔ and the denied ones after ❌,
+e.g. "✔️ view_channel, send_messages ❌ attach_files", or an empty cell for an overwrite that changes nothing.
+"""
+@lru_cache(maxsize=4096)
+def render_overwrite(allow, deny):
+    parts = []
+    for mark, value in ((ALLOWED, allow), (DENIED, deny)):
+        names = [name for name, bit in zip(PERMISSION_NAMES, PERMISSION_BITS) if value & bit]
+        if names:
+            parts.append(mark + " " + ", ".join(names))
+    return " ".join(parts)
+
+
+"""
+Maps the headings of a sheet to (column index, bit) pairs, once per sheet.
+Headings that are not permissions (names, Color, ID, empty cells) are left out.
+"""
+def permission_columns(headings):
+    return [(index, FLAG_BITS[heading]) for index, heading in enumerate(headings) if heading in FLAG_BITS]
+
+
+def parse_permissions(columns, row):
+    value = 0
+    for index, bit in columns:
+        if index < len(row) and row[index].strip().lower() in TRUE_CELLS:
+            value |= bit
+    return value
@@ -0,0 +1,89 @@
+"""
+This file holds the token buckets that keep the BOT's Google Sheets requests under Google's
+per-minute quota. LocalTokenBucket covers a single process (and the benchmark); FileTokenBucket
+keeps its state in a file under an exclusive lock, so every worker process started by launcher.py
+shares one budget for the whole project.
+Both return the tokens left after acquire(), for the metrics.
+
+A full bucket lets BURST requests through at once and the rest of the minute's budget refills it,
+so that no 60-second window ever holds more than requests_per_minute requests: a bucket holding
+the whole minute's budget would let a burst through, then a minute's worth of refills in the same window.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import time
+
+BURST = 5  # Requests let through at once by a full bucket.
+
+
+"""
+Returns the capacity and the refill rate, per second, of a bucket: the minute's budget minus the capacity refills it,
+and the capacity is cut to half of the budget when the budget is small.
+"""
+def _bucket_size(requests_per_minute, burst):
+    capacity = max(1, min(burst, requests_per_minute // 2))
+    return capacity, max(1, requests_per_minute - capacity) / 60
+
+
+"""
+Token bucket of a single process.
+"""
+class LocalTokenBucket:
+    def __init__(self, requests_per_minute, burst=BURST):
+        self.capacity, self.rate = _bucket_size(requests_per_minute, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:  # Waiters are served in order, one token each.
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return self.tokens
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+"""
+Token bucket shared by every process on the machine through a small JSON state file.
+The file is only locked while the bucket is refilled and a token is taken, never while waiting,
+and it is locked and read on a worker thread, so another process holding it never blocks the event loop.
+"""
+class FileTokenBucket:
+    def __init__(self, state_path, requests_per_minute, burst=BURST):
+        self.state_path = state_path
+        self.capacity, self.rate = _bucket_size(requests_per_minute, burst)
+        self.lock = asyncio.Lock()  # One waiter per process at a time; the file lock orders the processes.
+
+    def _take(self):
+        descriptor = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(descriptor, "r+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                content = state_file.read()
+                state = json.loads(content) if content else {"tokens": self.capacity, "updated": time.time()}
+                now = time.time()
+                tokens = min(self.capacity, state["tokens"] + max(0, now - state["updated"]) * self.rate)
+                taken = tokens >= 1
+                if taken:
+                    tokens -= 1
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps({"tokens": tokens, "updated": now}))
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+        return taken, tokens
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                taken, tokens = await asyncio.get_running_loop().run_in_executor(None, self._take)
+                if taken:
+                    return tokens
+                await asyncio.sleep((1 - tokens) / self.rate)
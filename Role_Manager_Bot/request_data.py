@@ -2,64 +2,141 @@
 This file holds the functions that handle the requests' bodies,
 as well as the data included in them, after they are processed and edited accordingly.
 """
+from permission_codec import render_rows
 
 
-def clear_request_body():
-    clear_data = {}
-    return clear_data
+"""
+Converts a 1-based column number to its A1 notation letters (1 -> A, 27 -> AA).
+"""
+def column_letter(column_number):
+    letters = ""
+    while column_number > 0:
+        column_number, remainder = divmod(column_number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+"""
+Builds the whole sheet as one 2-D grid: the permission names on the first row,
+followed by one row per role holding its name and its permission values.
+"""
+def build_grid(role_names, permission_names, permission_values):
+    grid = [[""] + list(permission_names)]
+    for i in range(len(role_names)):
+        grid.append([role_names[i]] + list(permission_values[i]))
+    return grid
+
+
+"""
+Pads the grid with empty cells up to the size of the previous export (rows, columns),
+so that the cells left over from a larger export are blanked by the same write.
+"""
+def pad_grid(grid, previous_size=(0, 0)):
+    rows = max(len(grid), previous_size[0])
+    columns = max(max(len(row) for row in grid), previous_size[1])
+    padded = [row + [""] * (columns - len(row)) for row in grid]
+    padded += [[""] * columns for _ in range(rows - len(grid))]
+    return padded
 
 
-def titles_request_body(role_names, permission_names):
-    name_data = [
-        {
-            "majorDimension": "COLUMNS",
-            "range": "A2",
-            "values": [role_names]
-        },  # Fills the first column with all of the role names.
-        {
-            "majorDimension": "ROWS",
-            "range": "B1",
-            "values": [permission_names]
-        },
-        ]  # Fills the first column with all of the permission names.
+"""
+Builds the spreadsheets().batchUpdate body that rewrites the whole sheet in one request:
+it blanks every cell of the sheet, grows its grid when the new one does not fit in its size (rows, columns),
+then writes the grid from A1. Empty cells are left out, since the sheet was just blanked.
+"""
+def export_request_body(sheet_id, grid, sheet_size):
+    rows = len(grid)
+    columns = max(len(row) for row in grid)
+    requests = [clear_tab_request(sheet_id)]
+    if rows > sheet_size[0]:
+        requests.append(grow_tab_request(sheet_id, rows - sheet_size[0]))
+    if columns > sheet_size[1]:
+        requests.append(grow_tab_request(sheet_id, columns - sheet_size[1], dimension="COLUMNS"))
+    cells = [{"values": [{"userEnteredValue": {"stringValue": value}} if value != "" else {} for value in row]} for row in grid]
+    requests.append({"updateCells": {"start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0}, "rows": cells, "fields": "userEnteredValue"}})
+    return tabs_request_body(requests)
 
+
+"""
+Compares the grid of the previous export with the new one, cell by cell,
+and returns the changed cells as a list of (range, values) runs, one run per
+group of adjacent changed cells on the same row.
+"""
+def changed_ranges(previous_grid, grid):
+    size = (max(len(grid), len(previous_grid)), max(len(row) for row in grid + previous_grid))
+    previous_grid, grid = pad_grid(previous_grid, size), pad_grid(grid, size)
+    ranges = []
+    for row_index in range(size[0]):
+        old_row, new_row = previous_grid[row_index], grid[row_index]
+        column = 0
+        while column < size[1]:
+            if old_row[column] == new_row[column]:
+                column += 1
+                continue
+            start = column
+            while column < size[1] and old_row[column] != new_row[column]:
+                column += 1
+            row_number = str(row_index + 1)
+            ranges.append((column_letter(start + 1) + row_number + ":" + column_letter(column) + row_number, new_row[start:column]))
+    return ranges
+
+
+"""
+Returns the A1 notation of a cell of another tab than the roles sheet, e.g. 'Members'!A2.
+"""
+def tab_range(title, row_number, column_number=1):
+    return "'" + title.replace("'", "''") + "'!" + column_letter(column_number) + str(row_number)
+
+
+def diff_request_body(ranges):
+    diff_data = [{"majorDimension": "ROWS", "range": cell_range, "values": [values]} for cell_range, values in ranges]
     request_body = {
-        "data": name_data,
+        "data": diff_data,
         "valueInputOption": "RAW"
     }
     return request_body
 
 
-def values_request_body(permission_values):
-    permission_data = []
-    for i in range(len(permission_values)):  # Creates a data list for the request in a smart way, so as to make the size of the request dynamic, depending on the amount of roles and permissions.
-        permission_data.append({"majorDimension": "ROWS", "range": "B" + str(i + 2), "values": [list(permission_values[i].values())]})
+"""
+Converts the permission values of the roles to ✔ and ❌ for user friendliness,
+followed by the color of each role. See permission_codec.py for more info.
+"""
+def build_rows(permission_values, colors):
+    rows = render_rows(permission_values)
+    for i in range(len(rows)):
+        rows[i].append(colors[i])
+    return rows
 
+
+"""
+Request bodies of the extra tabs of "!export all" (see tab_exporter.py).
+rows_request_body writes blocks of rows, given as (top left cell, rows) pairs.
+The others are spreadsheets().batchUpdate requests that add, resize, clear or grow a tab.
+"""
+def rows_request_body(blocks):
+    rows_data = [{"majorDimension": "ROWS", "range": cell_range, "values": rows} for cell_range, rows in blocks]
     request_body = {
-        "data": permission_data,
+        "data": rows_data,
         "valueInputOption": "RAW"
     }
     return request_body
 
 
-"""
-Converts all the True/False values to ✔ and ❌ for user friendliness.
-"""
-def build_rows(permission_values, permission_names, colors):
-    for i in range(len(permission_values)):
-        if permission_values[i]["administrator"]:
-            for perm_name in permission_names:
-                if perm_name == "Color":
-                    permission_values[i][perm_name] = colors[i]
-                    continue
-                permission_values[i][perm_name] = "✔️"
-        else:
-            for perm_name in permission_names:
-                if perm_name == "Color":
-                    permission_values[i][perm_name] = colors[i]
-                    continue
-                if permission_values[i][perm_name]:
-                    permission_values[i][perm_name] = "✔️"
-                else:
-                    permission_values[i][perm_name] = "❌"
-    return permission_values
+def add_tab_request(title, rows, columns):
+    return {"addSheet": {"properties": {"title": title, "gridProperties": {"rowCount": rows, "columnCount": columns, "frozenRowCount": 1}}}}
+
+
+def resize_tab_request(sheet_id, rows, columns):
+    return {"updateSheetProperties": {"properties": {"sheetId": sheet_id, "gridProperties": {"rowCount": rows, "columnCount": columns}}, "fields": "gridProperties(rowCount,columnCount)"}}
+
+
+def clear_tab_request(sheet_id):
+    return {"updateCells": {"range": {"sheetId": sheet_id}, "fields": "userEnteredValue"}}
+
+
+def grow_tab_request(sheet_id, length, dimension="ROWS"):
+    return {"appendDimension": {"sheetId": sheet_id, "dimension": dimension, "length": length}}
+
+
+def tabs_request_body(requests):
+    return {"requests": requests}
@@ -1,34 +1,139 @@
 # Regular Module Imports
-from os import path, sys
+import asyncio
+import time
+from functools import partial
+from os import environ
 # Discord API Imports
 import discord
 from discord.ext import commands
-# Google Docs/Sheets API Imports
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from googleapiclient.discovery import build
 # Assistance Files Imports
 from media import *
 from request_data import *
 from config import TOKEN
+from exporter import export_guild
+from tab_exporter import export_tabs
+from importer import plan_import, new_checkpoint, resume_checkpoint, run_import
+from sheet_reader import open_sheet
+import sheets_client  # Google Sheets API, initialized on first use.
+import live_sync
+import job_queue
+import config_store
+import metrics
+from quota import FileTokenBucket
 
-""" Google API Initializations """
-SCOPES = link("SCOPE")
-CREDENTIALS = ServiceAccountCredentials.from_json_keyfile_name(path.join(sys.path[0], "credentials.json"), SCOPES)
-CLIENT = gspread.authorize(CREDENTIALS)
-SERVICE = build("sheets", "v4", credentials=CREDENTIALS)
+""" Configuration Store Initialization """
+config_store.init()
+
+""" Google API Quota """
+if environ.get("QUOTA_FILE"):  # Set by launcher.py, so that every worker process shares one Sheets budget.
+    sheets_client.use_limiter(FileTokenBucket(environ["QUOTA_FILE"], sheets_client.REQUESTS_PER_MINUTE))
 
 """ Discord API Initializations """
 INTENTS = discord.Intents.default()
 INTENTS.message_content = True
-BOT = commands.Bot(command_prefix='!', intents=INTENTS)
+MEMBER_CACHE = {}
+if environ.get("MEMBERS_INTENT"):  # For the Members tab of !export all. A privileged intent: turn it on in the Developer Portal first.
+    INTENTS.members = True
+    MEMBER_CACHE = {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}  # Members are fetched when needed, never cached.
+SHARDING = {}  # Without SHARD_COUNT, discord.py picks the recommended amount of shards and runs all of them here.
+if environ.get("SHARD_COUNT"):  # Set by launcher.py for each worker process, e.g. SHARD_COUNT=8 SHARD_IDS=2,3
+    SHARDING["shard_count"] = int(environ["SHARD_COUNT"])
+    SHARDING["shard_ids"] = [int(shard_id) for shard_id in environ["SHARD_IDS"].split(",")] if environ.get("SHARD_IDS") else None
+BOT = commands.AutoShardedBot(command_prefix='!', intents=INTENTS, **MEMBER_CACHE, **SHARDING)
 
 
 @BOT.event
 async def on_ready():
+    config_store.warm()  # Load the servers' configuration in memory before the first command.
+    await metrics.start(environ.get("METRICS_PORT"), environ.get("METRICS_LOG_INTERVAL"))  # Both optional, see metrics.py.
     print("BOT is ready and running!")
 
 
+"""
+Instrumentation
+Every command is timed and counted, and errors that escape a command are recorded per server.
+See metrics.py for more info.
+"""
+@BOT.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+
+@BOT.after_invoke
+async def stop_command_timer(ctx):
+    metrics.increment("commands_total", command=ctx.command.name)
+    metrics.observe("command_seconds", time.perf_counter() - ctx.started_at, command=ctx.command.name)
+
+
+USER_ERRORS = (commands.CommandNotFound, commands.CheckFailure, commands.UserInputError)  # Mistakes of whoever typed the command, not failures of the BOT.
+
+
+"""
+Listening to on_command_error turns off discord.py's default handler, so every other error is logged here, with its traceback.
+"""
+@BOT.listen()
+async def on_command_error(ctx, exception):
+    if isinstance(exception, USER_ERRORS):
+        metrics.increment("command_user_errors_total", error=type(exception).__name__)
+        return
+    metrics.record_error(ctx.command.name if ctx.command else "unknown", ctx.guild.id if ctx.guild else None, exception)
+
+
+"""
+Job Queue
+!export, !imports and the live sync run their work through job_queue.py: one job at a time per server,
+waiting exports of a server merged into one, and servers taking turns. See job_queue.py for more info.
+"""
+async def export_job(guild, spreadsheet_id, full=False, tabs=False):
+    service = sheets_client.service()
+    await export_guild(service, guild, spreadsheet_id, full=full)  # See exporter.py for more info.
+    if tabs:  # The Channels and Members tabs, see tab_exporter.py for more info.
+        return await export_tabs(service, guild, spreadsheet_id, members=INTENTS.members)
+
+
+def submit_export(guild, spreadsheet_id, full=False, tabs=False):
+    return job_queue.submit(guild.id, "export", partial(export_job, guild, spreadsheet_id), coalesce=True, full=full, tabs=tabs)
+
+
+"""
+Builds the embed that tells a command is waiting for its turn in the queue.
+"""
+def queued_embed(position):
+    embed = discord.Embed(title="Waiting in the queue...", description=str(position) + " job(s) will run before this one. Use !status to follow it.", color=color("GREEN"))
+    embed.set_thumbnail(url=picture("GSHEET"))
+    return embed
+
+
+"""
+Live Sync
+Role events are queued per server and flushed into one export by live_sync.py,
+for the servers that turned it on with !livesync on.
+"""
+async def live_export(guild, role_ids):
+    spreadsheet_id = config_store.get_spreadsheet_id(guild.id)
+    if spreadsheet_id is None:  # The server turned the live sync on but has no worksheet configured.
+        return
+    await asyncio.shield(submit_export(guild, spreadsheet_id).future)  # Merged with an export of the server that is already waiting, if any.
+    metrics.LOG.info("Live sync of server %s exported %s changed role(s).", guild.id, len(role_ids))
+
+live_sync.init(live_export)
+
+
+@BOT.event
+async def on_guild_role_create(role):
+    live_sync.queue(role.guild, role.id)
+
+
+@BOT.event
+async def on_guild_role_update(before, after):
+    live_sync.queue(after.guild, after.id)
+
+
+@BOT.event
+async def on_guild_role_delete(role):
+    live_sync.queue(role.guild, role.id)
+
+
 """
 !setuphelp - Admin Only
 This command sends an embed with direct instructions on how
@@ -39,7 +144,7 @@ to get the Role Manager Bot set up and running on a server.
 async def setuphelp(ctx):
     embed = discord.Embed(title="Role Manager Setup Tutorial", description="Click the link above for detailed instructions with pictures!", url=link("TUTORIAL"),  color=color("GREEN"))
     embed.add_field(name="Step 1:", value="Create a Google Sheets Worksheet.", inline=False)
-    embed.add_field(name="Step 2:", value="Click the Share button on the top right and add this e-mail as an author: ```\n" + CREDENTIALS.service_account_email + "```", inline=False)
+    embed.add_field(name="Step 2:", value="Click the Share button on the top right and add this e-mail as an author: ```\n" + sheets_client.service_account_email() + "```", inline=False)
     embed.add_field(name="Step 3:", value="Select 8 columns and right-click >> Insert 8 Columns in your worksheet.", inline=False)
     embed.add_field(name="Step 4:", value="Run the !configure command and link your server with your Google spreadsheet.\n```!configure <WORKSHEET ID>```", inline=False)
     embed.add_field(name="Step 5:", value="Export the role permissions onto the Google Sheet using:\n``` !export ```", inline=False)
@@ -50,35 +155,25 @@ async def setuphelp(ctx):
 
 """
 !configure - Owner Only
-This command creates a file for the server in the database (serverdata) 
-and stores the Google Worksheet ID inside a .txt file named after the server's ID.
-If a file already exists, it prompts the user to update the file instead of reconfiguring it.
+This command adds the server to the database (see config_store.py)
+and stores the Google Worksheet ID under the server's ID.
+If the server is already in it, the Worksheet ID is updated instead of reconfiguring it.
 """
 @BOT.command()
 @commands.has_permissions(administrator=True)
 async def configure(ctx, *, spreadsheet_id=None):
-    if len(spreadsheet_id) == 44:  # Ensure input was given and that it is valid.
+    if spreadsheet_id is not None and len(spreadsheet_id) == 44:  # Ensure input was given and that it is valid.
         #if ctx.message.author.id == ctx.guild.owner_id:  # If the sender is the server owner, proceed.
-        file_name = str(ctx.guild.id) + ".txt"  # The name of the file is that of the server's unique ID.
-        try:  # If the file exists, open and read it and give the link.
-            with open(path.join("serverdata", file_name), "r+") as server_file:
-                server_file.truncate(0)
-                server_file.write(spreadsheet_id)
-
+        try:
+            if config_store.set_spreadsheet_id(ctx.guild.id, spreadsheet_id):  # If the server already had a worksheet, say it was updated.
                 embed = discord.Embed(title="You already have a worksheet!", description="Your spreadsheet ID has been updated instead!", color=color("GREEN"))
-                embed.add_field(name="Your worksheet has been linked! Here's the link: ", value=link("SPREADSHEET") + spreadsheet_id)
-                embed.set_thumbnail(url=picture("GSHEET"))
-                await ctx.send(embed=embed)
-        except FileNotFoundError:  # If it doesn't, create it and give the complete link.
-            with open(path.join("serverdata", file_name), "w+") as server_file:
-                server_file.write(spreadsheet_id)
-
-            embed = discord.Embed(title="Worksheet Configuration Complete!", description="Your server has been added to the database.", color=color("GREEN"))
+            else:  # If it didn't, it has now been added.
+                embed = discord.Embed(title="Worksheet Configuration Complete!", description="Your server has been added to the database.", color=color("GREEN"))
             embed.add_field(name="Your worksheet has been linked! Here's the link: ", value=link("SPREADSHEET") + spreadsheet_id)
             embed.set_thumbnail(url=picture("GSHEET"))
             await ctx.send(embed=embed)
         except Exception as exception:
-            print("Server ID:" + ctx.guild.id + "\n Exception:" + str(exception))
+            metrics.record_error(ctx.command.name, ctx.guild.id, exception)
             embed = discord.Embed(title="Something went wrong!", description="Please contact the BOT owner on GitHub!", color=color("RED"))
             embed.add_field(name="Error code: ", value=str(exception))
             embed.set_thumbnail(url=picture("ERROR"))
@@ -99,44 +194,41 @@ async def configure(ctx, *, spreadsheet_id=None):
 This command exports all the roles and their permissions
 from the Discord Server, organizes them and imports them 
 to the Google Sheet assigned to that Discord Server.
+Only the cells that changed since the last export are written,
+unless "!export full" is used to rewrite the whole sheet.
+"!export all" also writes the Channels tab (each role's permission overwrites per channel)
+and the Members tab (the roles each member holds).
+The export waits for the server's other jobs, and is merged with its waiting export if there is one.
 """
 @BOT.command()
 @commands.has_permissions(administrator=True)
-async def export(ctx):
+async def export(ctx, mode=None):
     #if ctx.message.author.id == ctx.guild.owner_id:
-        file_name = str(ctx.guild.id) + ".txt"
-        try:
-            with open(path.join("serverdata", file_name), "r+") as server_file:
-                spreadsheet_id = server_file.read()
-                try:
-                    role_list = ctx.guild.roles  # Export all the roles from a server. List of role type Objects.
-                    role_names = [role.name for role in role_list]  # Get all the role names from the role Objects.
-                    role_names.reverse() # Arrange in the order roles appear in Discord
-                    role_permissions = {role: dict(role.permissions) for role in role_list}  # Put Roles in a dictionary and their permission_values in sub-dictionaries.
-                    role_colors = [str(role.color) for role in role_list] # Get role colors
-                    permission_names = list(role_permissions[role_list[0]].keys())  # Get all the permission names.
-                    permission_names.append("Color") # Add a Color column
-                    permission_values = build_rows(list(role_permissions.values()), permission_names, role_colors)  # Get all of the permissions values and convert them to √ or X.
-                    permission_values.reverse() # Arrange in proper order again
-
-                    clear_request = SERVICE.spreadsheets().values().clear(spreadsheetId=spreadsheet_id, range="A1:AH1000", body=clear_request_body())
-                    titles_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=titles_request_body(role_names, permission_names))
-                    values_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=values_request_body(permission_values))
-                    clear_request.execute()  # Clears the spreadsheet.
-                    titles_request.execute()
-                    values_request.execute()  # Handling and execution of the requests to the Google API. See request_data.py for more info.
-
-                    embed = discord.Embed(title="Permission Export Complete!", description="Your server's role permission_values have been successfully exported!", color=color("GREEN"))
-                    embed.add_field(name="Here's the link to your worksheet: ", value=link("SPREADSHEET") + spreadsheet_id)
-                    embed.set_thumbnail(url=picture("GSHEET"))
-                    await ctx.send(embed=embed)
-                except Exception as exception:
-                    print("Server ID:" + ctx.guild.id + "\n Exception:" + str(exception))
-                    embed = discord.Embed(title="Worksheet unavailable!", description="There was an issue trying to access your server's worksheet!", color=color("RED"))
-                    embed.add_field(name="Make sure you have followed the !setuphelp steps correctly. If the issue persists, contact the BOT Owner.", value="```!setuphelp```")
-                    embed.set_thumbnail(url=picture("ERROR"))
-                    await ctx.send(embed=embed)
-        except FileNotFoundError:  # If the file does not exist, prompt user to configure.
+        spreadsheet_id = config_store.get_spreadsheet_id(ctx.guild.id)
+        if spreadsheet_id is not None:
+            try:
+                job = submit_export(ctx.guild, spreadsheet_id, full=(mode == "full"), tabs=(mode == "all"))
+                if job_queue.position(job) > 0:
+                    await ctx.send(embed=queued_embed(job_queue.position(job)))
+                tabs = await asyncio.shield(job.future)  # None unless the tabs were exported too.
+
+                embed = discord.Embed(title="Permission Export Complete!", description="Your server's role permission_values have been successfully exported!", color=color("GREEN"))
+                embed.add_field(name="Here's the link to your worksheet: ", value=link("SPREADSHEET") + spreadsheet_id)
+                if tabs is not None:
+                    embed.add_field(name="Channels tab:", value=str(tabs["channels"]) + " channels")
+                    if tabs["members"] is None:
+                        embed.add_field(name="Members tab:", value="Unavailable, the BOT runs without the members intent (MEMBERS_INTENT).")
+                    else:
+                        embed.add_field(name="Members tab:", value=str(tabs["members"]) + " members" + (" (" + str(tabs["members_left_out"]) + " left out, a spreadsheet holds 10 million cells at most)" if tabs["members_left_out"] else ""))
+                embed.set_thumbnail(url=picture("GSHEET"))
+                await ctx.send(embed=embed)
+            except Exception as exception:
+                metrics.record_error(ctx.command.name, ctx.guild.id, exception)
+                embed = discord.Embed(title="Worksheet unavailable!", description="There was an issue trying to access your server's worksheet!", color=color("RED"))
+                embed.add_field(name="Make sure you have followed the !setuphelp steps correctly. If the issue persists, contact the BOT Owner.", value="```!setuphelp```")
+                embed.set_thumbnail(url=picture("ERROR"))
+                await ctx.send(embed=embed)
+        else:  # If the server is not configured, prompt user to configure.
             embed = discord.Embed(title="No file found!", description="There was an issue trying to import your server's file from the database.", color=color("RED"))
             embed.add_field(name="You have to configure your server first. Please try the command !setuphelp for more information.", value="```!setuphelp```")
             embed.set_thumbnail(url=picture("ERROR"))
@@ -147,133 +239,136 @@ async def export(ctx):
         #embed.set_thumbnail(url=picture("ERROR"))
         #await ctx.send(embed=embed)
 
+"""
+!livesync on/off
+This command turns the live sync on or off for the server. While it is on,
+every role change is exported to the Google Sheet automatically, a few seconds
+after the changes stop, instead of waiting for !export.
+"""
+@BOT.command()
+@commands.has_permissions(administrator=True)
+async def livesync(ctx, mode=None):
+    if mode in ("on", "off"):
+        live_sync.set_enabled(ctx.guild.id, mode == "on")
+        embed = discord.Embed(title="Live Sync " + ("Enabled!" if mode == "on" else "Disabled!"), description="Role changes will " + ("now" if mode == "on" else "no longer") + " be exported to your worksheet automatically.", color=color("GREEN"))
+        embed.add_field(name="The live sync is currently: ", value="On" if live_sync.is_enabled(ctx.guild.id) else "Off")
+        embed.set_thumbnail(url=picture("GSHEET"))
+        await ctx.send(embed=embed)
+    else:  # If no valid mode was given, show the current state and how to change it.
+        embed = discord.Embed(title="No live sync mode specified!", description="The live sync is currently " + ("on" if live_sync.is_enabled(ctx.guild.id) else "off") + ".", color=color("RED"))
+        embed.add_field(name="Turn it on or off using: ", value="```!livesync on\n!livesync off```", inline=False)
+        embed.set_thumbnail(url=picture("ERROR"))
+        await ctx.send(embed=embed)
+
+"""
+!status
+This command shows the server's jobs: the export or import running now,
+the ones waiting in the queue with their position, and how long the last one took.
+"""
+@BOT.command()
+@commands.has_permissions(administrator=True)
+async def status(ctx):
+    state = job_queue.status(ctx.guild.id)
+    embed = discord.Embed(title="Role Manager Status", description="Exports and imports of this server run one at a time.", color=color("GREEN"))
+    running = state["running"]
+    embed.add_field(name="Running:", value=running["kind"].capitalize() + " for " + str(round(running["seconds"], 1)) + "s" if running else "Nothing", inline=False)
+    waiting = ["#" + str(job["position"]) + " " + job["kind"].capitalize() for job in state["waiting"]]
+    embed.add_field(name="Waiting in the queue:", value=", ".join(waiting) if waiting else "Nothing", inline=False)
+    last = state["last"]
+    embed.add_field(name="Last job:", value=last["kind"].capitalize() + (" failed after " if last["failed"] else " took ") + str(round(last["seconds"], 1)) + "s" if last else "None yet", inline=False)
+    embed.add_field(name="The live sync is currently: ", value="On" if live_sync.is_enabled(ctx.guild.id) else "Off")
+    embed.set_thumbnail(url=picture("GSHEET"))
+    await ctx.send(embed=embed)
+
+"""
+Builds the embed of the message that shows the progress of an import.
+"""
+def import_embed(title, done, total):
+    embed = discord.Embed(title=title, description=str(done) + "/" + str(total) + " operations done.", color=color("GREEN"))
+    embed.set_thumbnail(url=picture("GSHEET"))
+    return embed
+
 """
 !imports
 This command imports roles from sheet to Discord.
+New roles are created, changed names, permissions, colors and order are applied,
+and "!imports prune" also deletes the roles that are not in the sheet.
+The import is planned up front and checkpointed after every operation,
+so running it again after a failure resumes where it stopped.
+The next export rewrites the whole sheet, since the sheet may have been edited by hand before the import.
+It runs as a job of the server, after the exports and imports submitted before it.
 """
 @BOT.command()
 @commands.has_permissions(administrator=True)
-async def imports(ctx):
+async def imports(ctx, mode=None):
     #if ctx.message.author.id == ctx.guild.owner_id:
-        file_name = str(ctx.guild.id) + ".txt"
-        try:
-            with open(path.join("serverdata", file_name), "r+") as server_file:
-                spreadsheet_id = server_file.read()
-                try:
-                    values_request = SERVICE.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range="A1:AQ1000")
-                    valueRange = values_request.execute()
-                    headings = valueRange["values"][0]  # Get headings from the first row
-                    role_list = ctx.guild.roles
-                    roles_to_add = []
-                    for row in valueRange["values"]:
-                        name = row[0]
-                        if name == "":
-                            continue
-                        found = False
-                        for role in role_list:
-                            if name == role.name:
-                                found = True
-                                break
-                        if found == False:
-                            roles_to_add.append(name)
-                            print("Adding role:", name)
-
-                            #role_permissions = {role: dict(role.permissions) for role in role_list}  # Put Roles in a dictionary and their permission_values in sub-dictionaries.
-                            permObject = {}
-                            clr = None
-                            i = 0
-                            for heading in headings:
-                                if heading == "":
-                                    i += 1
-                                    continue
-                                if heading == "Color":
-                                    clr = discord.Colour.from_str(row[i])
-                                    i += 1
-                                    continue
-
-                                if row[i] == "✔️" or row[i] != "":
-                                    permObject[heading] = True
-
-                                i += 1
-
-                            perms = discord.Permissions.none()
-                            perms.create_instant_invite     = permObject["create_instant_invite"]                          
-                            perms.kick_members              = permObject["kick_members"] 
-                            perms.ban_members               = permObject["ban_members"]
-                            perms.administrator             = permObject["administrator"]
-                            perms.manage_channels           = permObject["manage_channels"]
-                            perms.manage_guild              = permObject["manage_guild"]
-                            perms.add_reactions             = permObject["add_reactions"]
-                            perms.view_audit_log            = permObject["view_audit_log"]
-                            perms.priority_speaker          = permObject["priority_speaker"]
-                            perms.stream                    = permObject["stream"]
-                            perms.read_messages             = permObject["read_messages"]
-                            perms.send_messages             = permObject["send_messages"]
-                            perms.send_tts_messages         = permObject["send_tts_messages"]
-                            perms.manage_messages           = permObject["manage_messages"]
-                            perms.embed_links               = permObject["embed_links"]
-                            perms.attach_files              = permObject["attach_files"]
-                            perms.read_message_history      = permObject["read_message_history"]
-                            perms.mention_everyone          = permObject["mention_everyone"]
-                            perms.external_emojis           = permObject["external_emojis"]
-                            perms.view_guild_insights       = permObject["view_guild_insights"]
-                            perms.connect                   = permObject["connect"]
-                            perms.speak                     = permObject["speak"]
-                            perms.mute_members              = permObject["mute_members"]
-                            perms.deafen_members            = permObject["deafen_members"]
-                            perms.move_members              = permObject["move_members"]
-                            perms.use_voice_activation      = permObject["use_voice_activation"]
-                            perms.change_nickname           = permObject["change_nickname"]
-                            perms.manage_nicknames          = permObject["manage_nicknames"]
-                            perms.manage_roles              = permObject["manage_roles"]
-                            perms.manage_webhooks           = permObject["manage_webhooks"]
-                            perms.manage_emojis             = permObject["manage_emojis"]
-                            perms.use_application_commands  = permObject["use_application_commands"]
-                            perms.request_to_speak          = permObject["request_to_speak"]
-                            perms.manage_events             = permObject["manage_events"]
-                            perms.manage_threads            = permObject["manage_threads"]
-                            perms.create_public_threads     = permObject["create_public_threads"]
-                            perms.create_private_threads    = permObject["create_private_threads"]
-                            perms.external_stickers         = permObject["external_stickers"]
-                            perms.send_messages_in_threads  = permObject["send_messages_in_threads"]
-                            perms.use_embedded_activities   = permObject["use_embedded_activities"]
-                            perms.moderate_members          = permObject["moderate_members"]
-
-                            #create_role(*, name=..., permissions=..., color=..., colour=..., hoist=..., display_icon=..., mentionable=..., reason=None)
-                            await ctx.guild.create_role(name=name, permissions=perms, color=clr)
-
-
-                    embed = discord.Embed(title="Import Test", description="Your sheet's values, hopefully", color=color("GREEN"))
-                    for role in roles_to_add:
-                        embed.add_field(name="Role added:", value=role)
-                    embed.set_thumbnail(url=picture("GSHEET"))
-                    await ctx.send(embed=embed)
-
-                    #role_list = ctx.guild.roles  # Export all the roles from a server. List of role type Objects.
-                    #role_list.reverse()
-                    #role_names = [role.name for role in role_list]  # Get all the role names from the role Objects.
-                    #role_permissions = {role: dict(role.permissions) for role in role_list}  # Put Roles in a dictionary and their permission_values in sub-dictionaries.
-                    #permission_names = list(role_permissions[role_list[0]].keys())  # Get all the permission names.
-                    #permission_values = permission_values_to_emojis(list(role_permissions.values()), permission_names)  # Get all of the permissions values and convert them to √ or X.
-
-                    #clear_request = SERVICE.spreadsheets().values().clear(spreadsheetId=spreadsheet_id, range="A1:AH1000", body=clear_request_body())
-                    #titles_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=titles_request_body(role_names, permission_names))
-                    #values_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=values_request_body(permission_values))
-                    #clear_request.execute()  # Clears the spreadsheet.
-                    #titles_request.execute()
-                    #values_request.execute()  # Handling and execution of the requests to the Google API. See request_data.py for more info.
-
-                    #embed = discord.Embed(title="Permission Export Complete!", description="Your server's role permission_values have been successfully exported!", color=color("GREEN"))
-                    #embed.add_field(name="Here's the link to your worksheet: ", value=link("SPREADSHEET") + spreadsheet_id)
-                    #embed.set_thumbnail(url=picture("GSHEET"))
-                    #await ctx.send(embed=embed)
-                except Exception as exception:
-                    print("Server ID:" + ctx.guild.id + "\n Exception:" + str(exception))
-                    embed = discord.Embed(title="Worksheet unavailable!", description="There was an issue trying to access your server's worksheet!", color=color("RED"))
-                    embed.add_field(name="Make sure you have followed the !setuphelp steps correctly. If the issue persists, contact the BOT Owner.", value="```!setuphelp```")
-                    embed.set_thumbnail(url=picture("ERROR"))
-                    await ctx.send(embed=embed)
-        except FileNotFoundError:  # If the file does not exist, prompt user to configure.
+        spreadsheet_id = config_store.get_spreadsheet_id(ctx.guild.id)
+        if spreadsheet_id is not None:
+            try:
+                async def import_job():
+                    with metrics.timer("stage_seconds", stage="import.read"):
+                        headings, rows = await open_sheet(sheets_client.service(), spreadsheet_id)  # Get headings from the first row, the rows are streamed in chunks.
+                    await config_store.delete_snapshot(ctx.guild.id)  # The sheet may have been edited by hand since the last export, so the next export rewrites it instead of diffing against the snapshot.
+                    with metrics.timer("stage_seconds", stage="import.plan"):
+                        plan = await plan_import(headings, rows, ctx.guild, prune=(mode == "prune"))  # Every operation is planned up front, as the rows arrive.
+                    checkpoint = resume_checkpoint(ctx.guild.id, spreadsheet_id, plan)  # Resume the last import if it stopped halfway through the same sheet.
+                    resumed = checkpoint is not None
+                    if not resumed:  # Otherwise save the new plan before running any of it.
+                        checkpoint = new_checkpoint(spreadsheet_id, plan)
+                        await config_store.save_checkpoint(ctx.guild.id, checkpoint)
+
+                    title = "Resuming Import..." if resumed else "Importing Roles..."
+                    status_message = await ctx.send(embed=import_embed(title, len(checkpoint["done"]), len(checkpoint["operations"])))
+
+                    async def on_progress(done, total):  # Progress is reported by editing the same message.
+                        await status_message.edit(embed=import_embed(title, done, total))
+
+                    with metrics.timer("stage_seconds", stage="import.run"):
+                        await run_import(ctx.guild, checkpoint, on_progress)  # See importer.py for more info.
+                    return plan, checkpoint, status_message
+
+                job = job_queue.submit(ctx.guild.id, "import", import_job)
+                if job_queue.position(job) > 0:
+                    await ctx.send(embed=queued_embed(job_queue.position(job)))
+                plan, checkpoint, status_message = await asyncio.shield(job.future)
+
+                roles_added = [operation["name"] for operation in checkpoint["operations"] if operation["type"] == "create"]
+                roles_updated = sum(1 for operation in checkpoint["operations"] if operation["type"] == "edit")
+                roles_deleted = sum(1 for operation in checkpoint["operations"] if operation["type"] == "delete")
+                embed = discord.Embed(title="Import Complete!", description="Your server's roles now match your sheet.", color=color("GREEN"))
+                embed.add_field(name="Roles added:", value=", ".join(roles_added)[:1024] if roles_added else "None", inline=False)
+                embed.add_field(name="Roles updated:", value=str(roles_updated))
+                embed.add_field(name="Roles deleted:", value=str(roles_deleted))
+                if plan["skipped"]:
+                    embed.add_field(name="Rows skipped (role names are limited to 100 characters):", value=", ".join(name[:32] + "..." for name in plan["skipped"])[:1024], inline=False)
+                embed.set_thumbnail(url=picture("GSHEET"))
+                await status_message.edit(embed=embed)
+
+                #role_list = ctx.guild.roles  # Export all the roles from a server. List of role type Objects.
+                #role_list.reverse()
+                #role_names = [role.name for role in role_list]  # Get all the role names from the role Objects.
+                #role_permissions = {role: dict(role.permissions) for role in role_list}  # Put Roles in a dictionary and their permission_values in sub-dictionaries.
+                #permission_names = list(role_permissions[role_list[0]].keys())  # Get all the permission names.
+                #permission_values = permission_values_to_emojis(list(role_permissions.values()), permission_names)  # Get all of the permissions values and convert them to √ or X.
+
+                #clear_request = SERVICE.spreadsheets().values().clear(spreadsheetId=spreadsheet_id, range="A1:AH1000", body=clear_request_body())
+                #titles_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=titles_request_body(role_names, permission_names))
+                #values_request = SERVICE.spreadsheets().values().batchUpdate(spreadsheetId=spreadsheet_id, body=values_request_body(permission_values))
+                #clear_request.execute()  # Clears the spreadsheet.
+                #titles_request.execute()
+                #values_request.execute()  # Handling and execution of the requests to the Google API. See request_data.py for more info.
+
+                #embed = discord.Embed(title="Permission Export Complete!", description="Your server's role permission_values have been successfully exported!", color=color("GREEN"))
+                #embed.add_field(name="Here's the link to your worksheet: ", value=link("SPREADSHEET") + spreadsheet_id)
+                #embed.set_thumbnail(url=picture("GSHEET"))
+                #await ctx.send(embed=embed)
+            except Exception as exception:
+                metrics.record_error(ctx.command.name, ctx.guild.id, exception)
+                embed = discord.Embed(title="Worksheet unavailable!", description="There was an issue trying to access your server's worksheet!", color=color("RED"))
+                embed.add_field(name="Make sure you have followed the !setuphelp steps correctly. If the issue persists, contact the BOT Owner.", value="```!setuphelp```")
+                embed.set_thumbnail(url=picture("ERROR"))
+                await ctx.send(embed=embed)
+        else:  # If the server is not configured, prompt user to configure.
             embed = discord.Embed(title="No file found!", description="There was an issue trying to import your server's file from the database.", color=color("RED"))
             embed.add_field(name="You have to configure your server first. Please try the command !setuphelp for more information.", value="```!setuphelp```")
             embed.set_thumbnail(url=picture("ERROR"))
@@ -288,4 +383,4 @@ async def imports(ctx):
 BOT RUN Command that logs in the bot with our credentials. 
 Has to be in the end of the file.
 """
-BOT.run(TOKEN)
+BOT.run(TOKEN, root_logger=True)  # root_logger lets the BOT's own log (see metrics.py) use discord.py's handler.
@@ -0,0 +1,36 @@
+"""
+This file holds the reader of a server's Google Sheet for the !imports command.
+Instead of fetching a fixed range, it first asks for the headings and the used rows
+(one small request), then streams the rows in chunks of CHUNK_ROWS through an async generator,
+so the rows can be processed as they arrive with memory bounded by the chunk size.
+"""
+import sheets_client
+from request_data import column_letter
+
+CHUNK_ROWS = 200  # Rows fetched per request.
+
+
+"""
+Returns the headings (first row) of the sheet and an async generator of the rows below them.
+The used range is the width of the headings by the last row that has a role name in column A.
+"""
+async def open_sheet(service, spreadsheet_id, chunk_rows=CHUNK_ROWS):
+    size_request = service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=["1:1", "A:A"])
+    value_ranges = (await sheets_client.execute(size_request)).get("valueRanges", [])
+    first_row = value_ranges[0].get("values", [[]]) if value_ranges else [[]]
+    headings = first_row[0] if first_row else []
+    row_count = len(value_ranges[1].get("values", [])) if len(value_ranges) > 1 else 0
+    return headings, read_rows(service, spreadsheet_id, max(len(headings), 1), row_count, chunk_rows)
+
+
+"""
+Yields the rows 2 to row_count of the sheet, column_count cells wide at most, fetching chunk_rows at a time.
+Google leaves trailing empty cells (and rows) out, so rows can be shorter than the headings or empty.
+"""
+async def read_rows(service, spreadsheet_id, column_count, row_count, chunk_rows=CHUNK_ROWS):
+    last_column = column_letter(column_count)
+    for start in range(2, row_count + 1, chunk_rows):
+        end = min(start + chunk_rows - 1, row_count)
+        chunk_request = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range="A" + str(start) + ":" + last_column + str(end))
+        for row in (await sheets_client.execute(chunk_request)).get("values", []):
+            yield row
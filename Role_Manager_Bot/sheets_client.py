@@ -0,0 +1,120 @@
+"""
+This file holds the asynchronous layer between the BOT and the Google Sheets API.
+The Google client library is blocking, so every request is executed on a bounded
+thread pool instead of the discord.py event loop, with a timeout per call.
+That way a slow Sheets call only delays the command that made it, not every guild.
+The Sheets service itself is built lazily, on first use, from the discovery document
+bundled with google-api-python-client, so the BOT starts without waiting on (or reaching) Google.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from os import path
+
+import httplib2
+from googleapiclient.discovery import build
+from oauth2client.service_account import ServiceAccountCredentials
+
+import metrics
+from media import link
+from quota import LocalTokenBucket
+
+MAX_WORKERS = 8  # Maximum amount of Sheets requests running at the same time.
+REQUEST_TIMEOUT = 30  # Seconds a single Sheets request may take before it is abandoned.
+REQUESTS_PER_MINUTE = 60  # Google's per-minute quota for one user of the project, shared by every server (see quota.py).
+CREDENTIALS_PATH = path.join(path.dirname(path.abspath(__file__)), "credentials.json")
+
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="sheets")
+_CREDENTIALS = None
+_SERVICE = None
+_INIT_LOCK = threading.Lock()  # The event loop and the worker threads may both reach for the credentials first.
+_LOCAL = threading.local()
+_MAKE_HTTP = None  # Replaced by use_http(), e.g. by the benchmark, whose fake requests need no connection.
+
+
+LIMITER = LocalTokenBucket(REQUESTS_PER_MINUTE)  # Replaced by use_limiter() when several processes share the quota.
+
+
+"""
+Replaces the limiter every request waits for, e.g. with a quota.FileTokenBucket shared by every worker process.
+"""
+def use_limiter(limiter):
+    global LIMITER
+    LIMITER = limiter
+
+
+"""
+Replaces how each worker thread's connection is made. make_http is called once per thread.
+"""
+def use_http(make_http):
+    global _MAKE_HTTP
+    _MAKE_HTTP = make_http
+
+
+"""
+Returns the service account credentials, loading them from credentials.json on first use.
+The same object is shared by every request, so its access token is fetched once and refreshed when it expires.
+"""
+def credentials():
+    global _CREDENTIALS
+    with _INIT_LOCK:
+        if _CREDENTIALS is None:
+            _CREDENTIALS = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_PATH, link("SCOPE"))
+    return _CREDENTIALS
+
+
+"""
+Returns the Sheets v4 service, building it on first use. static_discovery makes the client library
+use its bundled discovery document instead of downloading it.
+"""
+def service():
+    global _SERVICE
+    if _SERVICE is None:
+        _SERVICE = build("sheets", "v4", credentials=credentials(), static_discovery=True, cache_discovery=False)
+    return _SERVICE
+
+
+"""
+Reads the e-mail of the service account without loading the credentials, for !setuphelp.
+"""
+def service_account_email():
+    with open(CREDENTIALS_PATH, "r") as credentials_file:
+        return json.load(credentials_file)["client_email"]
+
+
+"""
+httplib2 connections are not thread safe, so each worker thread gets its own
+authorized connection. The credentials object (and its access token) is shared.
+"""
+def _thread_http():
+    http = getattr(_LOCAL, "http", None)
+    if http is None:
+        http = _MAKE_HTTP() if _MAKE_HTTP is not None else credentials().authorize(httplib2.Http(timeout=REQUEST_TIMEOUT))
+        _LOCAL.http = http
+    return http
+
+
+def _run(request):
+    return request.execute(http=_thread_http())
+
+
+"""
+Executes a prepared Sheets request (e.g. SERVICE.spreadsheets().values().get(...))
+on the thread pool and returns its response without blocking the event loop.
+Waits for the rate limiter first, then raises asyncio.TimeoutError if the response does not arrive in time.
+"""
+async def execute(request, timeout=REQUEST_TIMEOUT):
+    method = getattr(request, "methodId", None) or getattr(request, "method", "unknown")  # e.g. sheets.spreadsheets.values.update
+    with metrics.timer("sheets_quota_wait_seconds"):
+        tokens = await LIMITER.acquire()
+    metrics.set_gauge("sheets_quota_tokens", round(tokens, 2))
+    metrics.increment("sheets_requests_total", method=method)
+    loop = asyncio.get_running_loop()
+    try:
+        with metrics.timer("sheets_request_seconds", method=method):
+            return await asyncio.wait_for(loop.run_in_executor(EXECUTOR, partial(_run, request)), timeout=timeout)
+    except Exception as exception:
+        metrics.increment("sheets_errors_total", method=method, error=type(exception).__name__)
+        raise
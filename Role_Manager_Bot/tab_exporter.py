@@ -0,0 +1,144 @@
+"""
+This file holds the export of the extra tabs written by "!export all", next to the roles sheet:
+- Channels: one row per channel and one column per role, holding the role's permission overwrite in that channel,
+- Members: one row per member and one column per role, with ✔ on the roles the member holds.
+The rows are generated one at a time (members are fetched from Discord 1000 at a time) and written in
+requests of at most MAX_REQUEST_BYTES, so memory stays bounded however many members the server has.
+The tabs are created the first time, and cleared and resized on every export after that.
+The Members tab needs the members intent, which the BOT only asks for when MEMBERS_INTENT is set (see role_manager.py).
+"""
+import json
+
+from request_data import *
+from permission_codec import ALLOWED, render_overwrite
+import sheets_client
+import metrics
+
+CHANNELS_TAB = "Channels"
+MEMBERS_TAB = "Members"
+MAX_REQUEST_BYTES = 1024 * 1024  # Google advises at most 2 MB per request, so this leaves room for the JSON around the values.
+MAX_TAB_CELLS = 4000000  # A spreadsheet holds 10 million cells across its tabs. Rows past this many cells are left out.
+
+
+"""
+Yields the rows of the Channels tab: the headings, then the channels in the order Discord shows them,
+each category followed by its channels. roles are the columns, top to bottom.
+"""
+async def channel_rows(guild, roles):
+    role_ids = {role.id for role in roles}
+    yield ["Channel", "Type"] + [role.name for role in roles] + ["ID"]
+    for category, channels in guild.by_category():
+        for channel in ([category] if category is not None else []) + channels:
+            overwrites = {target.id: overwrite.pair() for target, overwrite in channel.overwrites.items() if target.id in role_ids}  # Members' overwrites are left out.
+            cells = [render_overwrite(overwrites[role.id][0].value, overwrites[role.id][1].value) if role.id in overwrites else "" for role in roles]
+            yield [channel.name, str(channel.type)] + cells + [str(channel.id)]
+
+
+"""
+Yields the rows of the Members tab: the headings, then every member as Discord pages them.
+Needs the members intent, and the members are not kept once their row is built.
+"""
+async def member_rows(guild, roles):
+    columns = {role.id: index + 1 for index, role in enumerate(roles)}
+    yield ["Member"] + [role.name for role in roles] + ["ID"]
+    async for member in guild.fetch_members(limit=None):
+        row = [str(member)] + [""] * len(roles) + [str(member.id)]
+        for role in member.roles:
+            if role.id in columns:
+                row[columns[role.id]] = ALLOWED
+        yield row
+
+
+"""
+Buffers the rows of the tabs and writes them with one values().batchUpdate request
+whenever MAX_REQUEST_BYTES of them are buffered. A tab's grid is grown before rows are written past its end.
+tabs maps each title to {"sheetId": ..., "rows": rows of its grid}.
+"""
+class TabWriter:
+    def __init__(self, service, spreadsheet_id, tabs):
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.tabs = tabs
+        self.blocks = []  # [title, first row number, rows] of the buffered rows.
+        self.size = 0
+        self.written = {}  # Title -> rows added so far.
+        self.requests = 0
+
+    async def add(self, title, row):
+        row_number = self.written.get(title, 0) + 1
+        self.written[title] = row_number
+        if self.blocks and self.blocks[-1][0] == title:
+            self.blocks[-1][2].append(row)
+        else:
+            self.blocks.append([title, row_number, [row]])
+        self.size += len(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+        if self.size >= MAX_REQUEST_BYTES:
+            await self.flush()
+
+    async def flush(self):
+        if not self.blocks:
+            return
+        grow = [grow_tab_request(self.tabs[title]["sheetId"], self.written[title] - self.tabs[title]["rows"]) for title in self.tabs if self.written.get(title, 0) > self.tabs[title]["rows"]]
+        if grow:  # More members joined since the grid was sized.
+            await sheets_client.execute(self.service.spreadsheets().batchUpdate(spreadsheetId=self.spreadsheet_id, body=tabs_request_body(grow)))
+            self.requests += 1
+            for title in self.tabs:
+                self.tabs[title]["rows"] = max(self.tabs[title]["rows"], self.written.get(title, 0))
+        rows_request = self.service.spreadsheets().values().batchUpdate(spreadsheetId=self.spreadsheet_id, body=rows_request_body([(tab_range(title, start), rows) for title, start, rows in self.blocks]))
+        await sheets_client.execute(rows_request)
+        self.requests += 1
+        self.blocks = []
+        self.size = 0
+
+
+"""
+Creates the tabs that are missing and clears and resizes the others, in one request.
+sizes maps each title to the (rows, columns) of its grid. Returns the tabs for TabWriter.
+"""
+async def prepare_tabs(service, spreadsheet_id, sizes):
+    metadata_request = service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties(sheetId,title)")
+    existing = {sheet["properties"]["title"]: sheet["properties"]["sheetId"] for sheet in (await sheets_client.execute(metadata_request)).get("sheets", [])}
+    requests = []
+    for title, (rows, columns) in sizes.items():
+        if title in existing:
+            requests += [resize_tab_request(existing[title], rows, columns), clear_tab_request(existing[title])]
+        else:
+            requests.append(add_tab_request(title, rows, columns))
+    replies = (await sheets_client.execute(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=tabs_request_body(requests)))).get("replies", [])
+    for reply in replies:
+        if "addSheet" in reply:
+            existing[reply["addSheet"]["properties"]["title"]] = reply["addSheet"]["properties"]["sheetId"]
+    return {title: {"sheetId": existing[title], "rows": rows} for title, (rows, _) in sizes.items()}
+
+
+"""
+Exports the Channels and Members tabs of a server to its Google Sheet, or only the Channels tab without members.
+Returns the amount of channels and members (None without members) written, the members left out because of
+the cell limit of a spreadsheet, and the number of requests sent.
+"""
+async def export_tabs(service, guild, spreadsheet_id, members=True):
+    roles = list(reversed(guild.roles))  # Top to bottom, like the roles sheet.
+    member_roles = roles[:-1]  # Every member holds @everyone.
+    max_member_rows = MAX_TAB_CELLS // (len(member_roles) + 2)
+    sizes = {CHANNELS_TAB: (len(guild.channels) + 1, len(roles) + 3)}
+    if members:
+        sizes[MEMBERS_TAB] = (min((guild.member_count or 0) + 1, max_member_rows), len(member_roles) + 2)
+    writer = TabWriter(service, spreadsheet_id, await prepare_tabs(service, spreadsheet_id, sizes))
+    with metrics.timer("stage_seconds", stage="export.channels"):
+        async for row in channel_rows(guild, roles):
+            await writer.add(CHANNELS_TAB, row)
+    tab_full = False
+    if members:
+        with metrics.timer("stage_seconds", stage="export.members"):
+            async for row in member_rows(guild, member_roles):
+                if writer.written.get(MEMBERS_TAB, 0) == max_member_rows:  # The tab is full, so stop fetching members.
+                    tab_full = True
+                    break
+                await writer.add(MEMBERS_TAB, row)
+    await writer.flush()
+    return {
+        "channels": writer.written.get(CHANNELS_TAB, 1) - 1,
+        "members": writer.written.get(MEMBERS_TAB, 1) - 1 if members else None,
+        "members_left_out": max(1, (guild.member_count or 0) - (writer.written[MEMBERS_TAB] - 1)) if tab_full else 0,
+        "requests": writer.requests + 2,  # The metadata and the tabs' setup.
+    }